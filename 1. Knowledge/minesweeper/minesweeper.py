@@ -1,6 +1,145 @@
+import collections
+import functools
 import itertools
+import math
 import random
-import copy
+
+# Largest number of search nodes spent enumerating one frontier component
+COMPONENT_SEARCH_LIMIT = 200000
+
+# Number of solved components remembered between moves
+COMPONENT_CACHE_SIZE = 1000
+
+class CellSet():
+    """
+    Set of board cells stored as the bits of an integer,
+    where cell (i, j) is bit i * width + j.
+    """
+
+    def __init__(self, width, cells=(), bits=0):
+        self.width = width
+        self.bits = bits
+        for cell in cells:
+            self.add(cell)
+
+    def __contains__(self, cell):
+        return (self.bits >> self.index(cell)) & 1 == 1
+
+    def __iter__(self):
+        for index in self.indices():
+            yield self.cell(index)
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __eq__(self, other):
+        if isinstance(other, CellSet):
+            return self.bits == other.bits
+        if isinstance(other, (set, frozenset)):
+            return set(self) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __le__(self, other):
+        return self.bits & ~self.coerce(other).bits == 0
+
+    def __lt__(self, other):
+        return self <= other and self.bits != self.coerce(other).bits
+
+    def __ge__(self, other):
+        return self.coerce(other) <= self
+
+    def __gt__(self, other):
+        return self.coerce(other) < self
+
+    def __sub__(self, other):
+        return CellSet(self.width, bits=self.bits & ~self.coerce(other).bits)
+
+    def __and__(self, other):
+        return CellSet(self.width, bits=self.bits & self.coerce(other).bits)
+
+    def __or__(self, other):
+        return CellSet(self.width, bits=self.bits | self.coerce(other).bits)
+
+    def __rsub__(self, other):
+        return self.coerce(other) - self
+
+    __rand__ = __and__
+    __ror__ = __or__
+
+    def __repr__(self):
+        return repr(set(self)) if self.bits else "set()"
+
+    issubset = __le__
+    difference = __sub__
+    intersection = __and__
+    union = __or__
+
+    def coerce(self, cells):
+        """
+        Returns cells as a CellSet of the same width.
+        """
+        if isinstance(cells, CellSet):
+            return cells
+        return CellSet(self.width, cells)
+
+    def index(self, cell):
+        """
+        Returns the flat index of a cell.
+        """
+        return cell[0] * self.width + cell[1]
+
+    def cell(self, index):
+        """
+        Returns the cell at a flat index.
+        """
+        return divmod(index, self.width)
+
+    def indices(self):
+        """
+        Yields the flat index of every cell in the set, in increasing order.
+        """
+        bits = self.bits
+
+        # Peel off the lowest bit while the set is small
+        if bits.bit_count() <= 64:
+            while bits:
+                lowest = bits & -bits
+                yield lowest.bit_length() - 1
+                bits ^= lowest
+            return
+
+        # Otherwise scan the binary digits once, lowest bit first
+        digits = bin(bits)[:1:-1]
+        index = digits.find("1")
+        while index != -1:
+            yield index
+            index = digits.find("1", index + 1)
+
+    def add(self, cell):
+        self.bits |= 1 << self.index(cell)
+
+    def discard(self, cell):
+        self.bits &= ~(1 << self.index(cell))
+
+    def remove(self, cell):
+        if cell not in self:
+            raise KeyError(cell)
+        self.discard(cell)
+
+    def copy(self):
+        return CellSet(self.width, bits=self.bits)
+
+    def update(self, cells):
+        self.bits |= self.coerce(cells).bits
+
+    def difference_update(self, cells):
+        self.bits &= ~self.coerce(cells).bits
+
 
 class Minesweeper():
     """
@@ -12,7 +151,7 @@ class Minesweeper():
         # Set initial width, height, and number of mines
         self.height = height
         self.width = width
-        self.mines = set()
+        self.mines = CellSet(width)
 
         # Initialize an empty field with no mines
         self.board = []
@@ -31,7 +170,10 @@ class Minesweeper():
                 self.board[i][j] = True
 
         # At first, player has found no mines
-        self.mines_found = set()
+        self.mines_found = CellSet(width)
+
+        # Neighbors of every cell, as bitmasks indexed by flat cell index
+        self.neighbors = neighbor_table(height, width)
 
     def print(self):
         """
@@ -59,23 +201,8 @@ class Minesweeper():
         not including the cell itself.
         """
 
-        # Keep count of nearby mines
-        count = 0
-
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    if self.board[i][j]:
-                        count += 1
-
-        return count
+        index = self.mines.index(cell)
+        return (self.mines.bits & self.neighbors[index]).bit_count()
 
     def won(self):
         """
@@ -92,7 +219,10 @@ class Sentence():
     """
 
     def __init__(self, cells, count):
-        self.cells = set(cells)
+        if isinstance(cells, CellSet):
+            self.cells = cells.copy()
+        else:
+            self.cells = set(cells)
         self.count = count
 
     def __eq__(self, other):
@@ -138,40 +268,100 @@ class Sentence():
     
     def get_neighbors(self, cell, height, width):
         """
-        Simply adds set of all neighboring cells for a given cell to self.cells.
+        Simply sets self.cells to the set of all neighboring cells for a given cell.
         Does not check if cell is known or played.
         """
-        neighbors = set() 
-        row = cell[0]
-        col = cell[1]
-        for i in range(0, height):
-            for j in range(0, width):
-                if (i == row - 1) or (i == row) or (i == row + 1):
-                    if (j == col -1) or (j == col) or (j == col + 1):
-                        if (i, j) != (row, col):
-                            neighbors.add((i, j))
-        self.cells = neighbors
+        index = cell[0] * width + cell[1]
+        self.cells = CellSet(width, bits=neighbor_table(height, width)[index])
 
 class MinesweeperAI():
     """
     Minesweeper game player
     """
 
-    def __init__(self, height=8, width=8):
+    def __init__(self, height=8, width=8, mines=None, quiet=False, deduction="subset"):
 
         # Set initial height and width
         self.height = height
         self.width = width
 
+        # Whether to keep the reasoning of the AI to itself
+        self.quiet = quiet
+
+        # How sentences are combined: "subset" compares overlapping pairs,
+        # "linear" eliminates over the whole frontier at once
+        if deduction not in ("subset", "linear"):
+            raise ValueError(f"Unknown deduction mode: {deduction}")
+        self.deduction = deduction
+
+        # Total number of mines on the board, if known
+        self.total_mines = mines
+
         # Keep track of which cells have been clicked on
-        self.moves_made = set()
+        self.moves_made = CellSet(width)
 
         # Keep track of cells known to be safe or mines
-        self.mines = set()
-        self.safes = set()
+        self.mines = CellSet(width)
+        self.safes = CellSet(width)
+
+        # Sentences about the game known to be true, keyed by sentence id
+        self.knowledge = dict()
 
-        # List of sentences about the game known to be true
-        self.knowledge = []
+        # Index from each flat cell index to the ids of the sentences that mention it
+        self.index = dict()
+
+        # Cell bits of every stored sentence, so duplicates are never stored
+        self.signatures = dict()
+
+        # Ids of sentences that changed and still need to be evaluated
+        self.worklist = collections.deque()
+        self.sentence_ids = itertools.count()
+
+        # Ids of sentences added since the last linear elimination
+        self.linear_pending = set()
+
+        # Solutions of previously enumerated frontier components
+        self.component_cache = dict()
+
+    def log(self, *args):
+        """
+        Prints a message about the AI's reasoning, unless running quietly.
+        """
+        if not self.quiet:
+            print(*args)
+
+    def add_sentence(self, sentence):
+        """
+        Adds a sentence to the knowledge base and queues it for evaluation.
+        Empty sentences and sentences already known are ignored.
+        """
+        if not sentence.cells:
+            return
+        signature = sentence.cells.bits
+        if signature in self.signatures:
+            return
+
+        key = next(self.sentence_ids)
+        self.knowledge[key] = sentence
+        self.signatures[signature] = key
+        for index in sentence.cells.indices():
+            self.index.setdefault(index, set()).add(key)
+        self.worklist.append(key)
+        if self.deduction == "linear":
+            self.linear_pending.add(key)
+
+    def remove_sentence(self, key):
+        """
+        Removes a sentence from the knowledge base and returns it.
+        """
+        sentence = self.knowledge.pop(key)
+        del self.signatures[sentence.cells.bits]
+        for index in sentence.cells.indices():
+            keys = self.index[index]
+            keys.discard(key)
+            if not keys:
+                del self.index[index]
+        return sentence
 
     def mark_mine(self, cell):
         """
@@ -179,8 +369,10 @@ class MinesweeperAI():
         to mark that cell as a mine as well.
         """
         self.mines.add(cell)
-        for sentence in self.knowledge:
+        for key in list(self.index.get(self.mines.index(cell), ())):
+            sentence = self.remove_sentence(key)
             sentence.mark_mine(cell)
+            self.add_sentence(sentence)
 
     def mark_safe(self, cell):
         """
@@ -188,64 +380,120 @@ class MinesweeperAI():
         to mark that cell as safe as well.
         """
         self.safes.add(cell)
-        for sentence in self.knowledge:
+        for key in list(self.index.get(self.safes.index(cell), ())):
+            sentence = self.remove_sentence(key)
             sentence.mark_safe(cell)
+            self.add_sentence(sentence)
 
     def evaluate_knowledge(self):
         """
-        Iterate through knowledge base and clean the data and make further inferences
+        Process queued sentences until no further inferences can be made.
+        In "subset" mode, each sentence is only compared against sentences
+        sharing a cell with it; in "linear" mode, the frontier is instead
+        eliminated as a whole once the queue is empty.
         """
         while True:
-            knowledge_copy = copy.deepcopy(self.knowledge)
-            
-            # Identify if any new safe moves were found
-            for sentence in self.knowledge:
-                if sentence.known_safes() != set():
-                    new_safes = []
-                    for safe_cell in sentence.known_safes():
-                        if safe_cell not in self.safes:
-                            print("new safe cell", safe_cell)
-                            new_safes.append(safe_cell)
-                    for cell in new_safes:
-                        self.mark_safe(cell)
-
-            # Identify if any new mines were found
-            for sentence in self.knowledge:
-                if sentence.known_mines() != set():
-                    found_mines = []
-                    for new_mine in sentence.known_mines():
-                        if new_mine not in self.mines:
-                            print("new mine found", new_mine)
-                            found_mines.append(new_mine)
-                    for mine in found_mines:
-                        self.mark_mine(mine)
-
-            # Clear out emply sets
-            for sentence in self.knowledge:
-                if sentence.cells == set():
-                    self.knowledge.remove(sentence)
-
-            # Make inferences
-            for sentence in self.knowledge:
-                for another_sentence in self.knowledge:
-                    if sentence != another_sentence:
-                        print("checking issubset")
-                        # Check to see if sentence is subset of another sentence
-                        if sentence.cells.issubset(another_sentence.cells):
-                            print("inferred sentence being made")
-                            another_sentence.cells.difference_update(sentence.cells)
-                            another_sentence.count = another_sentence.count - sentence.count
-                            # inferred_sentence = Sentence(cells=inferred_set, count=inferred_count)
-                            sentence.cells = set()
-                            sentence.count = 0
-                            # Apply the inference to knowledge base
-                            # if inferred_sentence not in self.knowledge:
-                            #     self.knowledge.append(inferred_sentence)
-                            
-            
-            # Break after all inferences are made
-            if knowledge_copy == self.knowledge:
-                break                    
+
+            # Once the queue is empty, look for deductions combining many sentences
+            if not self.worklist:
+                if self.deduction != "linear" or not self.evaluate_linear():
+                    break
+                continue
+
+            key = self.worklist.popleft()
+
+            # Skip sentences that were replaced since being queued
+            sentence = self.knowledge.get(key)
+            if sentence is None:
+                continue
+
+            # Sentence resolves all of its cells as safe
+            if sentence.known_safes():
+                for cell in list(sentence.known_safes()):
+                    self.log("new safe cell", cell)
+                    self.mark_safe(cell)
+                continue
+
+            # Sentence resolves all of its cells as mines
+            if sentence.known_mines():
+                for cell in list(sentence.known_mines()):
+                    self.log("new mine found", cell)
+                    self.mark_mine(cell)
+                continue
+
+            if self.deduction == "linear":
+                continue
+
+            # Find the other sentences sharing a cell with this one
+            related = set()
+            for index in sentence.cells.indices():
+                related.update(self.index[index])
+            related.discard(key)
+
+            # Replace any superset by its difference with the subset
+            for other_key in related:
+                other = self.knowledge.get(other_key)
+                if other is None:
+                    continue
+                if other.cells < sentence.cells:
+                    self.remove_sentence(key)
+                    self.add_sentence(Sentence(
+                        cells=sentence.cells - other.cells,
+                        count=sentence.count - other.count
+                    ))
+                    break
+                if sentence.cells < other.cells:
+                    self.remove_sentence(other_key)
+                    self.add_sentence(Sentence(
+                        cells=other.cells - sentence.cells,
+                        count=other.count - sentence.count
+                    ))
+
+    def evaluate_linear(self):
+        """
+        Derives safe cells and mines from many sentences at once.
+
+        Each frontier component with a sentence added since the last pass
+        is reduced on its own: its sentences are sparse integer equations
+        over its cells, brought to reduced row echelon form exactly. Each
+        reduced row is an equation over 0/1 cells: if its total equals the
+        sum of its negative (or positive) coefficients, every cell in it is
+        determined. Returns True if any cell was marked.
+        """
+        starts = [key for key in self.linear_pending if key in self.knowledge]
+        self.linear_pending.clear()
+
+        safes = set()
+        mines = set()
+        for cells, sentences in self.frontier_components(starts):
+            if len(sentences) < 2:
+                continue
+            equations = [
+                (dict.fromkeys(sentence.cells.indices(), 1), sentence.count)
+                for sentence in sentences
+            ]
+            for coefficients, total in reduce_rows(equations):
+
+                # Rows at a bound force the sign of every cell they mention
+                lowest = sum(c for c in coefficients.values() if c < 0)
+                highest = sum(c for c in coefficients.values() if c > 0)
+                if total == lowest:
+                    for cell, c in coefficients.items():
+                        (safes if c > 0 else mines).add(cell)
+                elif total == highest:
+                    for cell, c in coefficients.items():
+                        (mines if c > 0 else safes).add(cell)
+
+        # Only mark cells forced one way, should a cell be forced both ways
+        for index in sorted(safes - mines):
+            cell = self.safes.cell(index)
+            self.log("new safe cell", cell)
+            self.mark_safe(cell)
+        for index in sorted(mines - safes):
+            cell = self.mines.cell(index)
+            self.log("new mine found", cell)
+            self.mark_mine(cell)
+        return bool(safes ^ mines)
 
     def add_knowledge(self, cell, count):
         """
@@ -267,24 +515,17 @@ class MinesweeperAI():
         self.moves_made.add(cell)
         self.mark_safe(cell)
 
-        # Remove cell from all sentences in KB, and remove sentence if empty
-        for sentence in self.knowledge:
-            if cell in sentence.cells:
-                sentence.cells.remove(cell)
-            if sentence.cells == set():
-                self.knowledge.remove(sentence)
-
         # Make sentence for new move
         new_sentence = Sentence(cells=set(), count=count)
         new_sentence.get_neighbors(cell, self.height, self.width)
 
-        # Remove any cells found in mines, safes, moves_made
+        # Remove known mines (and their count) and known safe cells
+        new_sentence.count -= len(new_sentence.cells & self.mines)
         new_sentence.cells.difference_update(self.mines)
         new_sentence.cells.difference_update(self.safes)
-        new_sentence.cells.difference_update(self.moves_made)
 
         # Give sentence to knowledge base
-        self.knowledge.append(new_sentence)
+        self.add_sentence(new_sentence)
 
         # Evaluate any updates or changes
         self.evaluate_knowledge()
@@ -298,37 +539,345 @@ class MinesweeperAI():
         This function may use the knowledge in self.mines, self.safes
         and self.moves_made, but should not modify any of those values.
         """
-        print("safe cells: ", self.safes)
-        print("mines: ", self.mines)
+        self.log("safe cells: ", self.safes)
+        self.log("mines: ", self.mines)
 
         # Make new set of safe moves that have not been played
         practice_safe_sets = self.safes.difference(self.moves_made) # ;)
 
         # Pick random safe cell
-        if practice_safe_sets != set():
-            return random.sample(practice_safe_sets, 1)[0]
+        if practice_safe_sets:
+            return random.choice(list(practice_safe_sets))
         else:
             return None
 
+    def frontier_components(self, starts=None):
+        """
+        Splits the knowledge base into independent groups of sentences.
+        Returns a list of (cells, sentences) pairs, where cells are the flat
+        indices of the group and none of them appears in another group.
+        If `starts` is given, only the groups holding one of those
+        sentence ids are returned.
+        """
+        components = []
+        seen_keys = set()
+        seen_cells = set()
+        for start in self.knowledge if starts is None else starts:
+            if start in seen_keys:
+                continue
+
+            # Walk sentences connected through shared cells
+            seen_keys.add(start)
+            stack = [start]
+            cells = []
+            sentences = []
+            while stack:
+                key = stack.pop()
+                sentences.append(self.knowledge[key])
+                for cell in self.knowledge[key].cells.indices():
+                    if cell in seen_cells:
+                        continue
+                    seen_cells.add(cell)
+                    cells.append(cell)
+                    for other in self.index[cell]:
+                        if other not in seen_keys:
+                            seen_keys.add(other)
+                            stack.append(other)
+
+            components.append((cells, sentences))
+        return components
+
+    def enumerate_component(self, cells, sentences):
+        """
+        Counts the mine placements consistent with a group of sentences.
+        Returns (totals, cell_totals), where totals[k] is the number of
+        solutions with k mines and cell_totals[cell][k] the number of those
+        in which cell is a mine, or None if the search exceeds
+        COMPONENT_SEARCH_LIMIT nodes.
+        """
+        signature = frozenset(
+            (sentence.cells.bits, sentence.count) for sentence in sentences
+        )
+        if signature in self.component_cache:
+            return self.component_cache[signature]
+
+        # Constraint state for each sentence: mines still needed, cells left
+        position = {cell: i for i, cell in enumerate(cells)}
+        constraints = [[] for cell in cells]
+        remaining = []
+        unassigned = []
+        for s, sentence in enumerate(sentences):
+            remaining.append(sentence.count)
+            unassigned.append(len(sentence.cells))
+            for cell in sentence.cells.indices():
+                constraints[position[cell]].append(s)
+
+        n = len(cells)
+        totals = [0] * (n + 1)
+        cell_totals = {cell: [0] * (n + 1) for cell in cells}
+        nodes = 0
+
+        # Walk the cells in order with an explicit stack, trying each as
+        # safe then as a mine; choice[i] is the value cell i holds, or -1
+        choice = [-1] * n
+        mines = 0
+        i = 0
+        result = (totals, cell_totals)
+        while i >= 0:
+            nodes += 1
+            if nodes > COMPONENT_SEARCH_LIMIT:
+                result = None
+                break
+
+            # Record a complete, consistent assignment
+            if i == n:
+                nodes += n
+                totals[mines] += 1
+                for j, value in enumerate(choice):
+                    if value:
+                        cell_totals[cells[j]][mines] += 1
+                i -= 1
+                continue
+
+            # Undo the cell's current value, and back up once both are tried
+            value = choice[i]
+            if value >= 0:
+                for s in constraints[i]:
+                    remaining[s] += value
+                    unassigned[s] += 1
+                mines -= value
+            value += 1
+            if value > 1:
+                choice[i] = -1
+                i -= 1
+                continue
+
+            # Try the next value, moving on only if no sentence is broken
+            choice[i] = value
+            for s in constraints[i]:
+                remaining[s] -= value
+                unassigned[s] -= 1
+            mines += value
+            if all(0 <= remaining[s] <= unassigned[s] for s in constraints[i]):
+                i += 1
+
+        # Keep the cache from growing without bound over a long game
+        if len(self.component_cache) > COMPONENT_CACHE_SIZE:
+            self.component_cache.clear()
+        self.component_cache[signature] = result
+        return result
+
+    def mine_probabilities(self):
+        """
+        Returns a dict mapping each cell that has not been played and is not
+        a known mine to the probability that it contains a mine.
+
+        Frontier components are solved exactly and combined using the total
+        number of mines, when known; cells outside any sentence share the
+        mines left over. Components too large to enumerate are estimated
+        from the densest sentence covering each cell.
+        """
+        probabilities = dict()
+        exact = []
+        estimated_mines = 0
+        for cells, sentences in self.frontier_components():
+            result = self.enumerate_component(cells, sentences)
+            if result is not None:
+                exact.append(result)
+                continue
+            for cell in cells:
+                probability = max(
+                    sentence.count / len(sentence.cells)
+                    for sentence in sentences if (sentence.cells.bits >> cell) & 1
+                )
+                probabilities[self.safes.cell(cell)] = probability
+                estimated_mines += probability
+
+        # Safe cells not yet played
+        for cell in self.safes - self.moves_made:
+            probabilities[cell] = 0
+
+        # Cells that are unknown and not mentioned by any sentence
+        known = self.mines.bits | self.safes.bits
+        for cell in self.index:
+            known |= 1 << cell
+        interior = CellSet(
+            self.width, bits=((1 << (self.height * self.width)) - 1) & ~known
+        )
+
+        # Distribution of frontier mine counts, with and without each component
+        prefixes = [[1]]
+        for totals, cell_totals in exact:
+            prefixes.append(convolve(prefixes[-1], totals))
+        suffixes = [[1]]
+        for totals, cell_totals in reversed(exact):
+            suffixes.append(convolve(suffixes[-1], totals))
+        suffixes.reverse()
+
+        # Number of mines left to place off the frontier, if known
+        left = None
+        if self.total_mines is not None:
+            left = self.total_mines - len(self.mines) - round(estimated_mines)
+
+        # Ways to place the mines left off the frontier, given k on it
+        weight = interior_weights(len(interior), left, len(prefixes[-1]))
+        total = sum(ways * weight[k] for k, ways in enumerate(prefixes[-1]))
+        if total == 0:
+            # Mine count contradicts the frontier, so weigh solutions equally
+            left = None
+            weight = [1] * len(prefixes[-1])
+            total = sum(prefixes[-1])
+
+        # Per-cell probability within each exactly solved component
+        for c, (totals, cell_totals) in enumerate(exact):
+            others = convolve(prefixes[c], suffixes[c + 1])
+            weights = [
+                sum(ways * weight[k + s] for s, ways in enumerate(others))
+                for k in range(len(totals))
+            ]
+            for cell, counts in cell_totals.items():
+                probabilities[self.safes.cell(cell)] = sum(
+                    count * weights[k] for k, count in enumerate(counts)
+                ) / total
+
+        # Cells off the frontier are all equally likely to be mines
+        if interior:
+            if left is not None:
+                # Each interior cell holds a mine in (left - k) / cells of
+                # the placements with k mines on the frontier
+                density = sum(
+                    ways * weight[k] * (left - k)
+                    for k, ways in enumerate(prefixes[-1])
+                ) / (total * len(interior))
+            elif self.index:
+                density = sum(
+                    probabilities[self.safes.cell(cell)] for cell in self.index
+                ) / len(self.index)
+            else:
+                density = 0
+            for cell in interior:
+                probabilities[cell] = density
+
+        return probabilities
+
     def make_random_move(self):
         """
         Returns a move to make on the Minesweeper board.
-        Should choose randomly among cells that:
+        Should choose among cells that:
             1) have not already been chosen, and
             2) are not known to be mines
+        picking at random among those least likely to be a mine.
         """
-        # Grab all cell locations
-        available_cells = set()
-        for row in range(0, self.height):
-            for col in range(0, self.width):
-                available_cells.add((row, col))
-        
-        # Remove locations with mines and made moves
-        available_cells.difference_update(self.mines)
-        available_cells.difference_update(self.moves_made)
-
-        # Pick a random cell
-        if available_cells != set():
-            return random.sample(available_cells, 1)[0]
-        else:
-            return None
\ No newline at end of file
+        probabilities = self.mine_probabilities()
+        if not probabilities:
+            return None
+
+        # Pick a random cell among the lowest-risk ones
+        lowest = min(probabilities.values())
+        candidates = [
+            cell for cell, probability in probabilities.items()
+            if probability <= lowest + 1e-9
+        ]
+        return random.choice(candidates)
+
+
+def reduce_rows(rows):
+    """
+    Reduces a system of sparse integer equations to reduced row echelon
+    form, returning the reduced rows. Each row is a pair (coefficients,
+    total), where coefficients maps columns to nonzero integers.
+
+    Rows are combined as a * row - b * pivot and divided by their gcd,
+    so the arithmetic stays exact, and each pivot only visits the rows
+    that mention its column.
+    """
+    rows = [(dict(coefficients), total) for coefficients, total in rows]
+    mentions = dict()
+    for i, (coefficients, total) in enumerate(rows):
+        for column in coefficients:
+            mentions.setdefault(column, set()).add(i)
+
+    for i in range(len(rows)):
+        pivot, pivot_total = rows[i]
+        if not pivot:
+            continue
+        column = min(pivot)
+        a = pivot[column]
+
+        # Eliminate the column from every other row mentioning it
+        for j in mentions[column] - {i}:
+            coefficients, total = rows[j]
+            b = coefficients[column]
+            combined = {c: a * value for c, value in coefficients.items()}
+            for c, value in pivot.items():
+                value = combined.get(c, 0) - b * value
+                if value:
+                    combined[c] = value
+                else:
+                    del combined[c]
+            total = a * total - b * pivot_total
+            divisor = math.gcd(total, *combined.values())
+            if divisor > 1:
+                combined = {c: value // divisor for c, value in combined.items()}
+                total //= divisor
+
+            # Keep the index of mentions in step with the new row
+            for c in coefficients.keys() - combined.keys():
+                mentions[c].discard(j)
+            for c in combined.keys() - coefficients.keys():
+                mentions[c].add(j)
+            rows[j] = (combined, total)
+    return rows
+
+
+def interior_weights(cells, left, size):
+    """
+    Returns a list whose kth entry is the number of ways to place the
+    mines left off the frontier among `cells` cells when k of them are
+    on the frontier, for k up to `size` - 1. Every entry is 1 if the
+    number of mines left is unknown.
+
+    Only one binomial coefficient is computed; the rest follow from
+    comb(cells, m - 1) = comb(cells, m) * m / (cells - m + 1).
+    """
+    if left is None:
+        return [1] * size
+    weights = [0] * size
+    k = max(0, left - cells)
+    if k < size and left - k >= 0:
+        weights[k] = math.comb(cells, left - k)
+    for k in range(k + 1, min(size, left + 1)):
+        m = left - k + 1
+        weights[k] = weights[k - 1] * m // (cells - m + 1)
+    return weights
+
+
+def convolve(a, b):
+    """
+    Returns the convolution of two lists of counts, i.e. the number of ways
+    to reach each total by picking one entry from each list.
+    """
+    result = [0] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        if x:
+            for j, y in enumerate(b):
+                result[i + j] += x * y
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def neighbor_table(height, width):
+    """
+    Returns a tuple holding, for each flat cell index i * width + j
+    of a board, the bitmask of the flat indices of its neighbors.
+    """
+    neighbors = []
+    for i in range(height):
+        for j in range(width):
+            mask = 0
+            for row in range(max(i - 1, 0), min(i + 2, height)):
+                for col in range(max(j - 1, 0), min(j + 2, width)):
+                    if (row, col) != (i, j):
+                        mask |= 1 << (row * width + col)
+            neighbors.append(mask)
+    return tuple(neighbors)
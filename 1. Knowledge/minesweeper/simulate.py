@@ -0,0 +1,104 @@
+import multiprocessing
+import random
+import sys
+import time
+
+from minesweeper import Minesweeper, MinesweeperAI
+
+# Board sizes to play, as (height, width)
+BOARDS = [(8, 8), (16, 16), (16, 30)]
+
+# Fraction of the board's cells that hold a mine
+DENSITIES = [0.10, 0.15, 0.20]
+
+# Games played for each board size and density
+GAMES = 1000
+
+
+def main():
+
+    # Check usage
+    if len(sys.argv) > 3:
+        sys.exit("Usage: python simulate.py [games] [workers]")
+
+    # Parse command-line arguments
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else GAMES
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    # One job per game, each with its own seed
+    jobs = []
+    for height, width in BOARDS:
+        for density in DENSITIES:
+            mines = max(1, round(height * width * density))
+            for seed in range(games):
+                jobs.append((height, width, mines, seed))
+
+    # Play the games across a pool of worker processes
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.map(play, jobs, chunksize=max(1, games // 10))
+
+    # Combine the results of each configuration
+    totals = dict()
+    for job, result in zip(jobs, results):
+        config = totals.setdefault(job[:3], {
+            "games": 0, "wins": 0, "moves": 0,
+            "time": 0, "inference": 0, "knowledge": 0
+        })
+        config["games"] += 1
+        config["wins"] += result["won"]
+        config["moves"] += result["moves"]
+        config["time"] += result["time"]
+        config["inference"] += result["inference"]
+        config["knowledge"] = max(config["knowledge"], result["knowledge"])
+
+    # Print results
+    print(f"{'Board':>7} {'Mines':>5} {'Games':>6} {'Win rate':>8} "
+          f"{'Moves/s':>9} {'ms/move':>8} {'Max KB':>6}")
+    for (height, width, mines), config in totals.items():
+        moves = max(config["moves"], 1)
+        print(f"{height:>3}x{width:<3} {mines:>5} {config['games']:>6} "
+              f"{config['wins'] / config['games']:>8.1%} "
+              f"{moves / max(config['time'], 1e-9):>9.0f} "
+              f"{1000 * config['inference'] / moves:>8.3f} "
+              f"{config['knowledge']:>6}")
+
+
+def play(job):
+    """
+    Plays one game of Minesweeper with a quiet AI and no display.
+
+    Returns a dict with whether the game was won, the number of moves made,
+    the total time taken, the time spent in `add_knowledge` and the largest
+    number of sentences held in the AI's knowledge base.
+    """
+    height, width, mines, seed = job
+    random.seed(seed)
+    game = Minesweeper(height=height, width=width, mines=mines)
+    ai = MinesweeperAI(height=height, width=width, mines=mines, quiet=True)
+
+    result = {"won": False, "moves": 0, "time": 0, "inference": 0, "knowledge": 0}
+    start = time.perf_counter()
+    while result["moves"] < height * width - mines:
+
+        # Make a safe move if possible, otherwise the least risky one
+        move = ai.make_safe_move()
+        if move is None:
+            move = ai.make_random_move()
+        if move is None or game.is_mine(move):
+            break
+
+        # Let the AI draw its inferences from the revealed cell
+        inference = time.perf_counter()
+        ai.add_knowledge(move, game.nearby_mines(move))
+        result["inference"] += time.perf_counter() - inference
+        result["moves"] += 1
+        result["knowledge"] = max(result["knowledge"], len(ai.knowledge))
+    else:
+        result["won"] = True
+
+    result["time"] = time.perf_counter() - start
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,195 @@
+import collections
+import hashlib
+import itertools
+import json
+import multiprocessing
 import os
-import random
+import posixpath
 import re
 import sys
-import copy
+import time
+import urllib.parse
+
+import numpy as np
 
 DAMPING = 0.85
 SAMPLES = 10000
 
+# Number of random surfers moved together when sampling, and the
+# number of steps each takes before its visits start being counted
+WALKERS = 10000
+BURN_IN = 50
+
+# Independent batches sampled in parallel, and the z-score of the
+# confidence intervals computed from them (about 95%)
+BATCHES = 16
+CONFIDENCE_Z = 1.96
+
+# Characters read from an HTML file at a time while crawling, and the
+# longest unfinished tag carried over between reads
+CHUNK_SIZE = 1 << 16
+MAX_TAG = 1 << 16
+
+LINK = re.compile(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"")
+
+# Iteration stops once ranks change by less than this in total (L1 norm)
+TOLERANCE = 1e-6
+MAX_ITERATIONS = 1000
+
+# Blocks of pages updated in turn by the Gauss-Seidel solver, and the
+# number of iterations between extrapolations
+GAUSS_SEIDEL_BLOCKS = 64
+EXTRAPOLATION_PERIOD = 10
+
+# Pages read from disk at a time when iterating over an on-disk graph
+BLOCK_PAGES = 1 << 18
+
+# Forward push stops once no page holds more than this much residual
+# probability per link
+PUSH_TOLERANCE = 1e-4
+
 
 def main():
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python pagerank.py corpus")
+    if len(sys.argv) not in [2, 3]:
+        sys.exit("Usage: python pagerank.py corpus [processes]")
     corpus = crawl(sys.argv[1])
-    ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
-    print(f"PageRank Results from Sampling (n = {SAMPLES})")
-    for page in sorted(ranks):
-        print(f"  {page}: {ranks[page]:.4f}")
-    ranks = iterate_pagerank(corpus, DAMPING)
-    print(f"PageRank Results from Iteration")
-    for page in sorted(ranks):
-        print(f"  {page}: {ranks[page]:.4f}")
+    if len(sys.argv) == 3:
+        ranks, errors = parallel_sample_pagerank(
+            corpus, DAMPING, SAMPLES, processes=int(sys.argv[2])
+        )
+        print(f"PageRank Results from Parallel Sampling (n = {SAMPLES})")
+        for page in sorted(ranks):
+            print(f"  {page}: {ranks[page]:.4f} \u00b1 {errors[page]:.4f}")
+    else:
+        ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
+        print(f"PageRank Results from Sampling (n = {SAMPLES})")
+        for page in sorted(ranks):
+            print(f"  {page}: {ranks[page]:.4f}")
+    graph = Graph.from_corpus(corpus)
+    ranks, iterations, residual = power_iteration(graph, DAMPING, TOLERANCE)
+    print(f"PageRank Results from Iteration ({iterations} iterations, residual {residual:.2e})")
+    for page, rank in sorted(zip(graph.pages, ranks)):
+        print(f"  {page}: {rank:.4f}")
 
 
-def crawl(directory):
+def crawl(directory, processes=None):
     """
     Parse a directory of HTML pages and check for links to other pages.
     Return a dictionary where each key is a page, and values are
     a list of all other pages in the corpus that are linked to by the page.
     """
-    pages = dict()
+    graph = crawl_graph(directory, processes)
+    return {
+        page: set(graph.pages[link] for link in graph.links(i))
+        for i, page in enumerate(graph.pages)
+    }
 
-    # Extract all links from HTML files
-    for filename in os.listdir(directory):
-        if not filename.endswith(".html"):
-            continue
-        with open(os.path.join(directory, filename)) as f:
-            contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
-            pages[filename] = set(links) - {filename}
-
-    # Only include links to other pages in the corpus
-    for filename in pages:
-        pages[filename] = set(
-            link for link in pages[filename]
-            if link in pages
-        )
 
-    return pages
+def crawl_graph(directory, processes=None):
+    """
+    Return the link Graph of every HTML page under `directory`.
+
+    Pages are named by their path relative to `directory`, and files are
+    parsed in parallel by a pool of `processes` worker processes
+    (all in this process if `processes` is 1).
+    """
+    pages = find_pages(directory)
+    return link_graph(pages, parse_pages(directory, pages, processes))
+
+
+def find_pages(directory):
+    """
+    Return the sorted paths, relative to `directory`, of every HTML file
+    in its directory tree.
+    """
+    pages = []
+    for root, dirs, files in os.walk(directory):
+        for filename in files:
+            if filename.endswith(".html"):
+                path = os.path.relpath(os.path.join(root, filename), directory)
+                pages.append(path.replace(os.sep, "/"))
+    return sorted(pages)
+
+
+def parse_pages(directory, pages, processes=None):
+    """
+    Yield the set of links on each of `pages` in order, parsing the files
+    on a pool of `processes` worker processes (in this process if 1).
+    """
+    jobs = [(directory, page) for page in pages]
+    if processes == 1 or not jobs:
+        yield from map(extract_links, jobs)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap(extract_links, jobs, chunksize=64)
+
+
+def link_graph(pages, links):
+    """
+    Return the Graph of `pages`, given the set of links on each page in order.
+    Links to pages outside `pages`, and from a page to itself, are dropped.
+    """
+    index = {page: i for i, page in enumerate(pages)}
+
+    # Write each page's links into the edge list, recording where its run ends
+    indptr = np.zeros(len(pages) + 1, dtype=np.int64)
+    indices = []
+    for i, page_links in enumerate(links):
+        targets = set(index[link] for link in page_links if link in index) - {i}
+        indices.append(np.array(sorted(targets), dtype=np.int64))
+        indptr[i + 1] = indptr[i] + len(targets)
+
+    return Graph(pages, indptr, np.concatenate(indices) if indices else indptr[:0])
+
+
+def extract_links(job):
+    """
+    Return the set of pages linked to by a page, given as (directory, page).
+
+    The file is read a chunk at a time, and each link is resolved
+    relative to the page, dropping fragments, queries and external URLs.
+    """
+    directory, page = job
+    links = set()
+    leftover = ""
+    with open(os.path.join(directory, page), encoding="utf-8", errors="replace") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            text = leftover + chunk
+
+            # Hold back any tag that may continue into the next chunk
+            end = len(text) if not chunk else text.rfind("<")
+            if end == -1:
+                end = len(text)
+            for match in LINK.finditer(text, 0, end):
+                link = normalize_link(page, match.group(1))
+                if link is not None:
+                    links.add(link)
+            leftover = text[end:] if len(text) - end <= MAX_TAG else ""
+
+            if not chunk:
+                return links
+
+
+def normalize_link(page, link):
+    """
+    Return the corpus path a link on `page` points to,
+    or None if it points outside the corpus.
+    """
+    parts = urllib.parse.urlsplit(link)
+    if parts.scheme or parts.netloc:
+        return None
+    path = urllib.parse.unquote(parts.path)
+    if not path:
+        return page
+    if path.startswith("/"):
+        path = path.lstrip("/")
+    else:
+        path = posixpath.join(posixpath.dirname(page), path)
+    path = posixpath.normpath(path)
+    if path == ".." or path.startswith("../"):
+        return None
+    return path
 
 
 def transition_model(corpus, page, damping_factor):
@@ -77,7 +220,7 @@ def transition_model(corpus, page, damping_factor):
     return prob_dist
 
 
-def sample_pagerank(corpus, damping_factor, n):
+def sample_pagerank(corpus, damping_factor, n, seed=None):
     """
     Return PageRank values for each page by sampling `n` pages
     according to transition model, starting with a page at random.
@@ -86,28 +229,109 @@ def sample_pagerank(corpus, damping_factor, n):
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    # Initialize dict with all pages with count 0
-    pr_sample = dict([(page, 0) for page in corpus])
-    sample_page = None
+    graph = Graph.from_corpus(corpus)
+    counts = random_surfers(graph, damping_factor, n, np.random.default_rng(seed))
+    return dict(zip(graph.pages, (counts / n).tolist()))
+
+
+def parallel_sample_pagerank(corpus, damping_factor, n, processes=None,
+                             batches=BATCHES, seed=None):
+    """
+    Return (ranks, errors) by sampling `n` pages in `batches` independent
+    batches spread over a pool of `processes` worker processes.
+
+    Both are dictionaries keyed by page name: `ranks` holds the estimated
+    PageRank of each page, and `errors` the half-width of its confidence
+    interval, from the spread of the per-batch estimates.
+    """
+    graph = Graph.from_corpus(corpus)
+    batches = max(1, min(batches, n))
+
+    # Split the samples evenly, giving each batch its own random stream
+    sizes = [n // batches + (i < n % batches) for i in range(batches)]
+    streams = np.random.SeedSequence(seed).spawn(batches)
+    with multiprocessing.Pool(processes, initializer=share_graph, initargs=(graph,)) as pool:
+        counts = np.array(pool.starmap(
+            sample_batch, [(damping_factor, size, stream) for size, stream in zip(sizes, streams)]
+        ))
+
+    # Merge the visit counts, and compare batch estimates for the intervals
+    ranks = counts.sum(axis=0) / n
+    errors = np.zeros(len(graph))
+    if batches > 1:
+        estimates = counts / np.array(sizes)[:, np.newaxis]
+        errors = CONFIDENCE_Z * estimates.std(axis=0, ddof=1) / np.sqrt(batches)
+    return (
+        dict(zip(graph.pages, ranks.tolist())),
+        dict(zip(graph.pages, errors.tolist()))
+    )
+
+
+# Graph shared by the batches run in a worker process
+worker_graph = None
+
+
+def share_graph(graph):
+    """
+    Store the graph for the batches run in this worker process.
+    """
+    global worker_graph
+    worker_graph = graph
+
+
+def sample_batch(damping_factor, n, stream):
+    """
+    Return the visit counts of one batch of `n` samples on the worker's graph.
+    """
+    return random_surfers(worker_graph, damping_factor, n, np.random.default_rng(stream))
+
+
+def random_surfers(graph, damping_factor, n, rng, walkers=WALKERS):
+    """
+    Return an array counting the visits to each page of `graph` over `n`
+    samples, taken from up to `walkers` independent random surfers that
+    each start at a random page and move in lockstep.
+    """
+    size = len(graph)
+    walkers = min(walkers, n)
+    counts = np.zeros(size, dtype=np.int64)
+    pages = rng.integers(size, size=walkers)
+    for step in range(BURN_IN):
+        pages = surf(graph, damping_factor, pages, rng)
+
+    # Visits are buffered and counted together, so counting stays O(n)
+    visits = []
+    buffered = 0
+    remaining = n
+    while True:
+        visits.append(pages[:remaining])
+        buffered += len(visits[-1])
+        remaining -= len(visits[-1])
+        if buffered >= size or remaining == 0:
+            counts += np.bincount(np.concatenate(visits), minlength=size)
+            visits = []
+            buffered = 0
+        if remaining == 0:
+            return counts
+        pages = surf(graph, damping_factor, pages, rng)
+
 
-    # Iterate over n samples and increment page each time it is selected
-    for i in range(n):
-        if sample_page:
-            transition_dist = transition_model(corpus, sample_page, damping_factor)
-            sample_page = random.choices(list(transition_dist.keys()), weights=list(transition_dist.values()), k=1)[0]
-        else:
-            sample_page = random.choice(list(pr_sample.keys()))
-        # Record sample selection for each time it is chosen
-        pr_sample[sample_page] += 1
+def surf(graph, damping_factor, pages, rng):
+    """
+    Return the next page of each surfer currently on `pages`.
 
-    # Apply overall percentage by dividing each page count by n
-    for page in pr_sample:
-        pr_sample[page] /= n
-    
-    return pr_sample
+    Surfers follow a random link with probability `damping_factor`,
+    otherwise (or from a page without links) they jump to any page.
+    """
+    degree = graph.outdegree[pages]
+    follow = (rng.random(len(pages)) < damping_factor) & (degree > 0)
+    links = graph.indptr[pages[follow]] + rng.integers(degree[follow])
+    pages = rng.integers(len(graph), size=len(pages))
+    pages[follow] = graph.indices[links]
+    return pages
 
 
-def iterate_pagerank(corpus, damping_factor):
+def iterate_pagerank(corpus, damping_factor, tolerance=TOLERANCE):
     """
     Return PageRank values for each page by iteratively updating
     PageRank values until convergence.
@@ -116,42 +340,457 @@ def iterate_pagerank(corpus, damping_factor):
     their estimated PageRank value (a value between 0 and 1). All
     PageRank values should sum to 1.
     """
-    # Initialize a dict with {"page": 1/n} for all pages in corpus
-    new_dist = dict([(page, 1 / len(corpus)) for page in corpus])
-    finished = False
-
-    while not finished:
-        # Make copy before changing
-        prev_dist = copy.deepcopy(new_dist)
-        for page in corpus:
-            # Run the iterative algorithm on each page
-            new_dist[page] = iter_algorithm(damping_factor, len(corpus), page, corpus, new_dist)
-        # If any page has a difference over .001 from the previous run, the while loop will continue
-        for pg in new_dist:
-            finished = True
-            if abs(prev_dist[pg] - new_dist[pg]) > 0.001:
-                finished = False
-                break
-
-    return new_dist
-
-
-def iter_algorithm(d, n, p, corpus, pr):
-    """
-    PR(p) = ( (1-d) / n ) + ( d * sum( PR(i) / NumLinks(i) ) )
-                                   i
-    d = dampening number; n = # of possible pages; p = page; i = incoming pages                                  
-    """
-    page_sum = 0
-    # This for loop will calculate the sum portion of the equation
-    for i in corpus:
-        # Find all incoming pages. p = pg and i = i
-        if p in corpus[i]:
-            # Update the sum to include each instance for the probablity of page i divided by NumLinks on page i
-            page_sum += pr[i] / len(corpus[i])
-
-    # Insert sum into rest of iterative algorithm
-    return ((1 - d) / n) + (d * page_sum)
+    graph = Graph.from_corpus(corpus)
+    ranks, iterations, residual = power_iteration(graph, damping_factor, tolerance)
+    return dict(zip(graph.pages, ranks.tolist()))
+
+
+class Graph():
+    """
+    Link graph of a corpus in compressed sparse row (CSR) form.
+
+    Pages are numbered by their position in `pages`. The links of page i
+    are the page numbers indices[indptr[i]:indptr[i + 1]].
+    """
+
+    def __init__(self, pages, indptr, indices):
+        self.pages = pages
+        self.index = {page: i for i, page in enumerate(pages)}
+        self.indptr = indptr
+        self.indices = indices
+
+        # Number of links on each page, and the page each link comes from
+        self.outdegree = np.diff(self.indptr)
+        self.sources = np.repeat(np.arange(len(self.pages)), self.outdegree)
+        self.dangling = self.outdegree == 0
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """
+        Return the Graph of a corpus as returned by `crawl`.
+        """
+        pages = sorted(corpus)
+        index = {page: i for i, page in enumerate(pages)}
+
+        # Concatenate every page's links, recording where each page's run ends
+        indptr = np.zeros(len(pages) + 1, dtype=np.int64)
+        indices = []
+        for i, page in enumerate(pages):
+            indices.extend(sorted(index[link] for link in corpus[page]))
+            indptr[i + 1] = len(indices)
+        return cls(pages, indptr, np.array(indices, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.pages)
+
+    def links(self, page):
+        """
+        Return the numbers of the pages linked to by page number `page`.
+        """
+        return self.indices[self.indptr[page]:self.indptr[page + 1]]
+
+    def incoming(self):
+        """
+        Return (indptr, sources) listing the links into each page in CSR form:
+        the pages linking to page i are sources[indptr[i]:indptr[i + 1]].
+        """
+        order = np.argsort(self.indices, kind="stable")
+        indptr = np.searchsorted(self.indices[order], np.arange(len(self) + 1))
+        return indptr, self.sources[order]
+
+    def step(self, ranks, damping_factor):
+        """
+        Returns the ranks after one step of the random surfer.
+        Pages without links are treated as linking to every page.
+        """
+        n = len(self)
+        share = np.divide(
+            ranks, self.outdegree, out=np.zeros(n), where=~self.dangling
+        )
+        linked = np.bincount(self.indices, weights=share[self.sources], minlength=n)
+        spread = (1 - damping_factor + damping_factor * ranks[self.dangling].sum()) / n
+        return spread + damping_factor * linked
+
+
+def power_iteration(graph, damping_factor, tolerance=TOLERANCE, ranks=None,
+                    solver="jacobi", callback=None):
+    """
+    Return (ranks, iterations, residual) from power iteration on `graph`,
+    starting from `ranks` (uniform by default) and stopping once the
+    L1 change between successive rank vectors drops below `tolerance`.
+
+    `solver` names one of SOLVERS, or is a function with the same
+    signature. If given, `callback(iteration, residual, seconds)` is
+    called after every iteration with the time it took.
+
+    `ranks` is an array ordered like `graph.pages`, and `residual` is the
+    L1 change of the final iteration.
+    """
+    if ranks is None:
+        ranks = np.full(len(graph), 1 / len(graph))
+    if not callable(solver):
+        solver = SOLVERS[solver]
+
+    residual = np.inf
+    iterations = 0
+    iterates = solver(graph, damping_factor, ranks)
+    while residual >= tolerance and iterations < MAX_ITERATIONS:
+        start = time.perf_counter()
+        new_ranks = next(iterates)
+        residual = np.abs(new_ranks - ranks).sum()
+        ranks = new_ranks
+        iterations += 1
+        if callback is not None:
+            callback(iterations, residual, time.perf_counter() - start)
+
+    return ranks, iterations, residual
+
+
+def jacobi(graph, damping_factor, ranks):
+    """
+    Yield successive rank vectors, updating every page from the previous vector.
+    """
+    while True:
+        ranks = graph.step(ranks, damping_factor)
+        yield ranks
+
+
+def gauss_seidel(graph, damping_factor, ranks):
+    """
+    Yield successive rank vectors, updating the pages in GAUSS_SEIDEL_BLOCKS
+    blocks, where each block already uses the new ranks of the blocks before it.
+    """
+    n = len(graph)
+    indptr, sources = graph.incoming()
+    targets = np.repeat(np.arange(n), np.diff(indptr))
+    bounds = np.linspace(0, n, min(GAUSS_SEIDEL_BLOCKS, n) + 1).astype(np.int64)
+    ranks = ranks.copy()
+    while True:
+        share = np.divide(ranks, graph.outdegree, out=np.zeros(n), where=~graph.dangling)
+        dangling = ranks[graph.dangling].sum()
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            links = slice(indptr[low], indptr[high])
+            linked = np.bincount(
+                targets[links] - low, weights=share[sources[links]], minlength=high - low
+            )
+            block = (1 - damping_factor + damping_factor * dangling) / n + damping_factor * linked
+
+            # Later blocks see this block's new ranks
+            dangling += (block - ranks[low:high])[graph.dangling[low:high]].sum()
+            ranks[low:high] = block
+            np.divide(
+                block, graph.outdegree[low:high],
+                out=share[low:high], where=~graph.dangling[low:high]
+            )
+
+        ranks /= ranks.sum()
+        yield ranks.copy()
+
+
+def aitken(graph, damping_factor, ranks):
+    """
+    Yield successive rank vectors, replacing every EXTRAPOLATION_PERIOD-th
+    Jacobi iterate by its componentwise Aitken delta-squared extrapolation.
+    """
+    history = []
+    for iteration in itertools.count(1):
+        ranks = graph.step(ranks, damping_factor)
+        history = history[-2:] + [ranks]
+        if iteration % EXTRAPOLATION_PERIOD == 0 and len(history) == 3:
+            x0, x1, x2 = history
+            denominator = x2 - 2 * x1 + x0
+            usable = np.abs(denominator) > 1e-12 * x2
+            ranks = x2.copy()
+            ranks[usable] -= (x2 - x1)[usable] ** 2 / denominator[usable]
+            ranks = normalize(ranks)
+            history = [ranks]
+        yield ranks
+
+
+def quadratic(graph, damping_factor, ranks):
+    """
+    Yield successive rank vectors, replacing every EXTRAPOLATION_PERIOD-th
+    Jacobi iterate by the quadratic extrapolation of the last four iterates
+    (Kamvar et al., 2003), which removes the next two largest error terms.
+    """
+    history = []
+    for iteration in itertools.count(1):
+        ranks = graph.step(ranks, damping_factor)
+        history = history[-3:] + [ranks]
+        if iteration % EXTRAPOLATION_PERIOD == 0 and len(history) == 4:
+            x0, x1, x2, x3 = history
+
+            # Least-squares fit of the error's characteristic polynomial
+            differences = np.stack([x1 - x0, x2 - x0], axis=1)
+            (g1, g2), *_ = np.linalg.lstsq(differences, x0 - x3, rcond=None)
+            ranks = normalize((g1 + g2 + 1) * x1 + (g2 + 1) * x2 + x3)
+            history = [ranks]
+        yield ranks
+
+
+def normalize(ranks):
+    """
+    Return `ranks` with negative values clipped to 0, rescaled to sum to 1.
+    """
+    ranks = np.clip(ranks, 0, None)
+    return ranks / ranks.sum()
+
+
+# Solvers accepted by power_iteration, by name
+SOLVERS = {
+    "jacobi": jacobi,
+    "gauss-seidel": gauss_seidel,
+    "aitken": aitken,
+    "quadratic": quadratic,
+}
+
+
+def personalized_pagerank(graph, damping_factor, teleport, tolerance=TOLERANCE):
+    """
+    Return (ranks, iterations, residual) for a batch of personalized
+    PageRanks, solved together by power iteration.
+
+    `teleport` is an array with one column per personalization, giving the
+    distribution over pages the surfer jumps to (and leaves pages without
+    links for) instead of a uniformly random page. `ranks` has the same
+    shape, and `residual` is the largest L1 change of any column in the
+    final iteration.
+    """
+    teleport = teleport / teleport.sum(axis=0)
+    indptr, sources = graph.incoming()
+    linked = np.diff(indptr) > 0
+    ranks = teleport.copy()
+    residual = np.inf
+    iterations = 0
+    while residual >= tolerance and iterations < MAX_ITERATIONS:
+
+        # Sum the shares sent along the links into each page, for every column
+        share = ranks / np.maximum(graph.outdegree, 1)[:, np.newaxis]
+        incoming = np.zeros_like(ranks)
+        if len(sources):
+            incoming[linked] = np.add.reduceat(share[sources], indptr[:-1][linked], axis=0)
+        dangling = ranks[graph.dangling].sum(axis=0)
+        new_ranks = damping_factor * incoming + (1 - damping_factor + damping_factor * dangling) * teleport
+
+        residual = np.abs(new_ranks - ranks).sum(axis=0).max()
+        ranks = new_ranks
+        iterations += 1
+
+    return ranks, iterations, residual
+
+
+def teleport_matrix(graph, personalizations):
+    """
+    Return the teleport array for `personalized_pagerank`, given a list of
+    dictionaries mapping page names to (unnormalized) preference weights.
+    """
+    teleport = np.zeros((len(graph), len(personalizations)))
+    for column, weights in enumerate(personalizations):
+        for page, weight in weights.items():
+            teleport[graph.index[page], column] = weight
+    return teleport
+
+
+def push_pagerank(graph, damping_factor, source, tolerance=PUSH_TOLERANCE):
+    """
+    Return an approximate PageRank personalized to the single page `source`,
+    as a dictionary of the pages with a nonzero estimate.
+
+    Uses forward push: probability is moved from a residual vector into the
+    estimate page by page, only touching pages near `source`, until no page
+    holds more than `tolerance` residual per link. Pages without links
+    return their residual to `source`.
+    """
+    start = graph.index[source]
+    estimate = dict()
+    residual = {start: 1.0}
+    queue = collections.deque([start])
+    while queue:
+        page = queue.popleft()
+        mass = residual.pop(page, 0)
+        degree = int(graph.outdegree[page])
+        if mass <= tolerance * max(degree, 1):
+            if mass:
+                residual[page] = mass
+            continue
+
+        # Keep the teleporting share, and spread the rest along the links
+        estimate[page] = estimate.get(page, 0) + (1 - damping_factor) * mass
+        targets = graph.links(page).tolist() if degree else [start]
+        share = damping_factor * mass / len(targets)
+        for target in targets:
+            residual[target] = residual.get(target, 0) + share
+            if residual[target] > tolerance * max(int(graph.outdegree[target]), 1):
+                queue.append(target)
+
+    return {graph.pages[page]: value for page, value in estimate.items()}
+
+
+def crawl_to_disk(directory, path, processes=None):
+    """
+    Crawl the HTML pages under `directory` like `crawl_graph`, writing
+    the link graph straight to the on-disk graph directory `path`.
+
+    The directory holds `pages.txt`, the page names one per line, and
+    the CSR arrays `indptr.bin` and `indices.bin` as raw int64 values.
+    Only the page table is kept in memory while crawling.
+    """
+    pages = find_pages(directory)
+    index = {page: i for i, page in enumerate(pages)}
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "pages.txt"), "w") as f:
+        f.writelines(page + "\n" for page in pages)
+
+    # Append each page's links to the edge list as it is parsed
+    with open(os.path.join(path, "indptr.bin"), "wb") as indptr, \
+            open(os.path.join(path, "indices.bin"), "wb") as indices:
+        edges = 0
+        indptr.write(np.int64(edges).tobytes())
+        for i, links in enumerate(parse_pages(directory, pages, processes)):
+            targets = set(index[link] for link in links if link in index) - {i}
+            indices.write(np.array(sorted(targets), dtype=np.int64).tobytes())
+            edges += len(targets)
+            indptr.write(np.int64(edges).tobytes())
+
+
+def save_graph(graph, path):
+    """
+    Write an in-memory Graph to the on-disk graph directory `path`
+    (see `crawl_to_disk`).
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "pages.txt"), "w") as f:
+        f.writelines(page + "\n" for page in graph.pages)
+    np.asarray(graph.indptr, dtype=np.int64).tofile(os.path.join(path, "indptr.bin"))
+    np.asarray(graph.indices, dtype=np.int64).tofile(os.path.join(path, "indices.bin"))
+
+
+def load_pages(path):
+    """
+    Return the list of page names of the on-disk graph at `path`.
+    """
+    with open(os.path.join(path, "pages.txt")) as f:
+        return f.read().splitlines()
+
+
+def disk_power_iteration(path, damping_factor, tolerance=TOLERANCE):
+    """
+    Return (ranks, iterations, residual) like `power_iteration`, for the
+    on-disk graph at `path`, without loading it into memory.
+
+    The CSR arrays are memory-mapped and read BLOCK_PAGES pages at a time.
+    The rank vectors are memory-mapped float64 files too, and the final
+    ranks are left in `ranks.bin`, ordered like `pages.txt`.
+    """
+    indptr = np.memmap(os.path.join(path, "indptr.bin"), dtype=np.int64, mode="r")
+    indices = np.memmap(os.path.join(path, "indices.bin"), dtype=np.int64, mode="r")
+    n = len(indptr) - 1
+    files = [os.path.join(path, "ranks.bin"), os.path.join(path, "next.bin")]
+    ranks = np.memmap(files[0], dtype=np.float64, mode="w+", shape=(n,))
+    new_ranks = np.memmap(files[1], dtype=np.float64, mode="w+", shape=(n,))
+    ranks[:] = 1 / n
+
+    residual = np.inf
+    iterations = 0
+    while residual >= tolerance and iterations < MAX_ITERATIONS:
+
+        # Send each page's share of rank along its links, a block at a time
+        new_ranks[:] = 0
+        dangling = 0
+        for low in range(0, n, BLOCK_PAGES):
+            high = min(low + BLOCK_PAGES, n)
+            bounds = np.asarray(indptr[low:high + 1])
+            degree = np.diff(bounds)
+            block = np.asarray(ranks[low:high])
+            dangling += block[degree == 0].sum()
+            share = np.divide(block, degree, out=np.zeros(high - low), where=degree > 0)
+            np.add.at(new_ranks, indices[bounds[0]:bounds[-1]], np.repeat(share, degree))
+
+        # Add the teleporting and dangling rank, measuring the change
+        spread = (1 - damping_factor + damping_factor * dangling) / n
+        residual = 0
+        for low in range(0, n, BLOCK_PAGES):
+            high = min(low + BLOCK_PAGES, n)
+            block = spread + damping_factor * new_ranks[low:high]
+            residual += np.abs(block - ranks[low:high]).sum()
+            new_ranks[low:high] = block
+
+        ranks, new_ranks = new_ranks, ranks
+        files.reverse()
+        iterations += 1
+
+    # Leave the final ranks in ranks.bin, and remove the other vector
+    ranks.flush()
+    del ranks, new_ranks
+    final = os.path.join(path, "ranks.bin")
+    if files[0] == final:
+        os.remove(files[1])
+    else:
+        os.replace(files[0], final)
+    return np.memmap(final, dtype=np.float64, mode="r", shape=(n,)), iterations, residual
+
+
+def incremental_pagerank(directory, damping_factor, state, tolerance=TOLERANCE,
+                         processes=None):
+    """
+    Return (ranks, iterations, residual, changed) for the corpus in
+    `directory`, reusing the links and ranks saved in the file `state`
+    by a previous call, and saving the new ones there.
+
+    Only files whose modification time or size changed are read, and
+    only those whose content hash changed are parsed again. Power
+    iteration then starts from the previous ranks, so small changes
+    converge in a few iterations. `ranks` is a dictionary keyed by page
+    name, and `changed` the list of pages that were parsed.
+    """
+    previous = {"pages": dict(), "ranks": dict()}
+    if os.path.exists(state):
+        with open(state) as f:
+            previous = json.load(f)
+
+    # Keep the links of files that are unchanged since the last call
+    pages = find_pages(directory)
+    files = dict()
+    changed = []
+    for page in pages:
+        path = os.path.join(directory, page)
+        stat = os.stat(path)
+        known = previous["pages"].get(page)
+        if known and (known["mtime"], known["size"]) == (stat.st_mtime_ns, stat.st_size):
+            files[page] = known
+            continue
+        digest = file_digest(path)
+        if known and known["digest"] == digest:
+            files[page] = dict(known, mtime=stat.st_mtime_ns, size=stat.st_size)
+            continue
+        files[page] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "digest": digest}
+        changed.append(page)
+
+    # Parse only the new and modified files
+    for page, links in zip(changed, parse_pages(directory, changed, processes)):
+        files[page]["links"] = sorted(links)
+    graph = link_graph(pages, (files[page]["links"] for page in pages))
+
+    # Start from the previous ranks, giving new pages an even share
+    ranks = np.array([previous["ranks"].get(page, 1 / len(pages)) for page in pages])
+    ranks /= ranks.sum()
+    ranks, iterations, residual = power_iteration(graph, damping_factor, tolerance, ranks)
+    ranks = dict(zip(pages, ranks.tolist()))
+
+    with open(state, "w") as f:
+        json.dump({"pages": files, "ranks": ranks}, f)
+    return ranks, iterations, residual, changed
+
+
+def file_digest(path):
+    """
+    Return the SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,169 @@
+import csv
+import functools
+import hashlib
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from crossword import Crossword, Dictionary
+from generate import CrosswordCreator
+
+
+def main():
+
+    # Check usage
+    if len(sys.argv) not in [3, 4]:
+        sys.exit("Usage: python batch.py manifest directory [processes]")
+
+    # Parse command-line arguments
+    manifest = sys.argv[1]
+    directory = sys.argv[2]
+    processes = int(sys.argv[3]) if len(sys.argv) == 4 else None
+
+    # Read the jobs, with paths relative to the manifest
+    jobs = read_manifest(manifest)
+    os.makedirs(directory, exist_ok=True)
+
+    # Compile each words file once, before the workers all load them
+    for words in sorted({job["words"] for job in jobs}):
+        Dictionary(words)
+
+    # Generate the crosswords across a pool of worker processes
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(
+            generate,
+            [(job, directory) for job in jobs],
+            chunksize=max(1, len(jobs) // (4 * (processes or os.cpu_count()))),
+        )
+
+    # Record which result belongs to which job
+    with open(os.path.join(directory, "results.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["structure", "words", "seed", "key", "status", "seconds"])
+        for job, result in zip(jobs, results):
+            writer.writerow([
+                job["structure"], job["words"], job["seed"],
+                result["key"], result["status"], f"{result['seconds']:.3f}"
+            ])
+
+    # Print summary
+    statuses = [result["status"] for result in results]
+    print(f"{len(jobs)} jobs: {statuses.count('solved')} solved, "
+          f"{statuses.count('unsolvable')} unsolvable, "
+          f"{statuses.count('cached')} cached")
+
+
+def read_manifest(filename):
+    """
+    Read a CSV manifest with a header row and the columns `structure`,
+    `words` and `seed`, and optionally `image`, which is "yes" to render
+    the crossword as an image too.
+
+    Return a list of jobs, one dict per row, with paths made relative to
+    the current directory.
+    """
+    base = os.path.dirname(filename)
+    jobs = []
+    with open(filename) as f:
+        for row in csv.DictReader(f):
+            jobs.append({
+                "structure": os.path.join(base, row["structure"]),
+                "words": os.path.join(base, row["words"]),
+                "seed": int(row["seed"]),
+                "image": (row.get("image") or "").strip().lower() == "yes"
+            })
+    return jobs
+
+
+def generate(task):
+    """
+    Generate the crossword of one job, given as (job, directory).
+
+    The result is written to `directory` under a key hashed from the
+    contents of the structure and words files and the seed: the grid as
+    text in <key>.txt, and as an image in <key>.png if the job asks for
+    one. Jobs whose files already exist are not solved again.
+
+    Return a dict with the key, the status ("solved", "unsolvable" or
+    "cached") and the seconds taken.
+    """
+    job, directory = task
+    start = time.perf_counter()
+    key = job_key(job["structure"], job["words"], job["seed"])
+    text = os.path.join(directory, f"{key}.txt")
+    image = os.path.join(directory, f"{key}.png") if job["image"] else None
+
+    # Reuse an earlier result for the same inputs
+    if os.path.exists(text) and (image is None or os.path.exists(image)):
+        return {"key": key, "status": "cached", "seconds": time.perf_counter() - start}
+
+    # Solve the crossword from its seed
+    random.seed(job["seed"])
+    creator = CrosswordCreator(load_crossword(job["structure"], job["words"]))
+    assignment = creator.solve()
+
+    # Write the image, then the grid or the lack of one, each to a
+    # temporary file first so that no partial result is ever cached
+    partial = os.path.join(directory, f"{key}.{os.getpid()}")
+    if assignment is None:
+        contents = "No solution.\n"
+    else:
+        contents = grid_text(creator, assignment)
+        if image is not None:
+            creator.save(assignment, partial + ".png")
+            os.replace(partial + ".png", image)
+    with open(partial + ".txt", "w") as f:
+        f.write(contents)
+    os.replace(partial + ".txt", text)
+
+    status = "unsolvable" if assignment is None else "solved"
+    return {"key": key, "status": status, "seconds": time.perf_counter() - start}
+
+
+def grid_text(creator, assignment):
+    """
+    Return the crossword `assignment` as the text `CrosswordCreator.print`
+    shows.
+    """
+    letters = creator.letter_grid(assignment)
+    lines = []
+    for i in range(creator.crossword.height):
+        line = ""
+        for j in range(creator.crossword.width):
+            if creator.crossword.structure[i][j]:
+                line += letters[i][j] or " "
+            else:
+                line += "█"
+        lines.append(line + "\n")
+    return "".join(lines)
+
+
+@functools.lru_cache(maxsize=None)
+def load_crossword(structure, words):
+    """
+    Return the Crossword for a structure and words file, parsing each
+    pair only once per worker process.
+    """
+    return Crossword(structure, words)
+
+
+@functools.lru_cache(maxsize=None)
+def job_key(structure, words, seed):
+    """
+    Return the hex digest identifying a job by the contents of its
+    structure and words files and its seed.
+    """
+    digest = hashlib.sha256()
+    for path in (structure, words):
+        with open(path, "rb") as f:
+            contents = f.read()
+        digest.update(len(contents).to_bytes(8, "little"))
+        digest.update(contents)
+    digest.update(str(seed).encode())
+    return digest.hexdigest()
+
+
+if __name__ == "__main__":
+    main()
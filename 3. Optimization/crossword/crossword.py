@@ -1,3 +1,23 @@
+import bisect
+import functools
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Directory, next to a words file, holding its compiled dictionary
+DICTIONARY_SUFFIX = ".dict"
+
+# Where dictionaries are compiled instead, named by the digest of their
+# words file's path, when the words file's directory cannot be written
+DICTIONARY_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "crossword")
+
+# Type of the letter codes in a compiled dictionary
+LETTER_DTYPE = np.uint16
+
+
 class Variable():
 
     ACROSS = "across"
@@ -35,6 +55,246 @@ class Variable():
         return f"Variable({self.i}, {self.j}, {direction}, {self.length})"
 
 
+class WordSet():
+    """
+    Set of words from a crossword's vocabulary, stored as the bits of an
+    integer, where bit k stands for the word `crossword.vocabulary[k]`.
+    """
+
+    def __init__(self, crossword, bits=0):
+        self.crossword = crossword
+        self.bits = bits
+
+    def __contains__(self, word):
+        k = self.crossword.dictionary.word_id(word)
+        return k is not None and (self.bits >> k) & 1 == 1
+
+    def __iter__(self):
+        vocabulary = self.crossword.vocabulary
+        for k in self.ids().tolist():
+            yield vocabulary[k]
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __eq__(self, other):
+        if isinstance(other, WordSet):
+            return self.bits == other.bits
+        if isinstance(other, (set, frozenset)):
+            return set(self) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(set(self)) if self.bits else "set()"
+
+    def add(self, word):
+        k = self.crossword.dictionary.word_id(word)
+        if k is None:
+            raise KeyError(word)
+        self.bits |= 1 << k
+
+    def discard(self, word):
+        if word in self:
+            self.bits ^= 1 << self.crossword.dictionary.word_id(word)
+
+    def remove(self, word):
+        if word not in self:
+            raise KeyError(word)
+        self.discard(word)
+
+    def copy(self):
+        return WordSet(self.crossword, self.bits)
+
+    def ids(self):
+        """
+        Return the numbers of the words in the set, in increasing order,
+        as an array. The words of a domain all have the same length, so
+        they sit together in the bits, above the lowest one.
+        """
+        if not self.bits:
+            return np.zeros(0, dtype=np.int64)
+        low = (self.bits & -self.bits).bit_length() - 1
+        bits = self.bits >> low
+        packed = np.frombuffer(
+            bits.to_bytes((bits.bit_length() + 7) // 8, "little"), dtype=np.uint8
+        )
+        return np.flatnonzero(np.unpackbits(packed, bitorder="little")) + low
+
+
+class Overlaps(dict):
+    """
+    Mapping from pairs of overlapping variables to their overlap,
+    returning None for any pair that does not overlap.
+    """
+
+    def __missing__(self, key):
+        return None
+
+
+class LazyIndex(dict):
+    """
+    Mapping from keys to values, such as bitsets of word numbers,
+    computing each value with `build(key)` the first time it is looked up.
+    """
+
+    def __init__(self, build):
+        super().__init__()
+        self.build = build
+
+    def __missing__(self, key):
+        value = self[key] = self.build(key)
+        return value
+
+
+class Dictionary():
+    """
+    Compiled form of a words file, kept in the directory named after the
+    file plus DICTIONARY_SUFFIX (or in DICTIONARY_CACHE) and compiled
+    again whenever the file changes.
+
+    Words are numbered by length, and then alphabetically, so that the
+    words of each length have consecutive numbers. The directory holds:
+        words.txt       the words in order, one per line
+        alphabet.txt    the letters used, in order, on one line
+        lengths.txt     "length count" lines, one per word length
+        letters-L.bin   the letters of the words of length L, as a
+                        (count, L) array of positions in the alphabet
+        index-L.bin     for each position and letter, the words of length
+                        L with that letter there, as a (L, letters, bytes)
+                        array of packed little-endian bitsets
+        source.txt      SHA-256 digest of the words file, then its
+                        modification time (ns) and size, written last
+    The .bin arrays of each length are memory-mapped, and the words read,
+    only once they are needed.
+
+    A compiled copy whose recorded modification time and size match the
+    words file is used as it is; the file is only hashed when they differ.
+    """
+
+    def __init__(self, words_file):
+        stamp = file_stamp(words_file)
+        path_digest = hashlib.sha256(os.path.abspath(words_file).encode()).hexdigest()
+        nearby = words_file + DICTIONARY_SUFFIX
+        cached = os.path.join(DICTIONARY_CACHE, path_digest + DICTIONARY_SUFFIX)
+
+        # Use a compiled copy, next to the file or in the cache, made from
+        # the file as it is now
+        self.path = None
+        for path in (nearby, cached):
+            if compiled_source(path)[1] == stamp:
+                self.path = path
+                break
+
+        # Otherwise check the contents, and compile the file again if they
+        # changed, in the cache if the file's directory is read-only
+        if self.path is None:
+            with open(words_file, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            for path in (nearby, cached):
+                if compiled_source(path)[0] == digest:
+                    self.path = path
+                    restamp_dictionary(path, digest, stamp)
+                    break
+            else:
+                try:
+                    compile_dictionary(words_file, nearby, digest, stamp)
+                    self.path = nearby
+                except OSError:
+                    compile_dictionary(words_file, cached, digest, stamp)
+                    self.path = cached
+
+        # Load the letters
+        with open(os.path.join(self.path, "alphabet.txt")) as f:
+            self.alphabet = list(f.read().rstrip("\n"))
+        self.codes = {letter: k for k, letter in enumerate(self.alphabet)}
+
+        # Note where the words of each length start, and map their arrays
+        # the first time they are used
+        self.offsets = dict()
+        self.counts = dict()
+        offset = 0
+        with open(os.path.join(self.path, "lengths.txt")) as f:
+            for line in f:
+                length, count = map(int, line.split())
+                self.offsets[length] = offset
+                self.counts[length] = count
+                offset += count
+        self.letters = LazyIndex(self.map_letters)
+        self.indexes = LazyIndex(self.map_index)
+
+    def map_letters(self, length):
+        """
+        Memory-map the letters of the words of `length` letters.
+        """
+        return np.memmap(
+            os.path.join(self.path, f"letters-{length}.bin"),
+            dtype=LETTER_DTYPE, mode="r", shape=(self.counts[length], length)
+        )
+
+    def map_index(self, length):
+        """
+        Memory-map the bitsets of the words of `length` letters.
+        """
+        return np.memmap(
+            os.path.join(self.path, f"index-{length}.bin"), dtype=np.uint8, mode="r",
+            shape=(length, len(self.alphabet), (self.counts[length] + 7) // 8)
+        )
+
+    @functools.cached_property
+    def vocabulary(self):
+        """
+        List of the words, in order by their numbers.
+        """
+        with open(os.path.join(self.path, "words.txt")) as f:
+            return f.read().splitlines()
+
+    def word_id(self, word):
+        """
+        Return the number of `word`, or None if it is not in the dictionary.
+        The words of each length are in alphabetical order, so it is found
+        by binary search among them.
+        """
+        length = len(word)
+        if length not in self.counts:
+            return None
+        low = self.offsets[length]
+        high = low + self.counts[length]
+        k = bisect.bisect_left(self.vocabulary, word, low, high)
+        return k if k < high and self.vocabulary[k] == word else None
+
+    def letter_codes(self, length, ids):
+        """
+        Return the letters of the words of `length` letters numbered
+        `ids`, as an array with a row of alphabet positions per word.
+        """
+        return self.letters[length][np.asarray(ids) - self.offsets[length]]
+
+    def length_bits(self, length):
+        """
+        Return the bitset of the words with `length` letters.
+        """
+        if length not in self.counts:
+            return 0
+        return ((1 << self.counts[length]) - 1) << self.offsets[length]
+
+    def letter_bits(self, key):
+        """
+        Return the bitset of the words of `length` letters with `letter`
+        at `position`, given `key` as (length, position, letter).
+        """
+        length, position, letter = key
+        code = self.codes.get(letter)
+        if length not in self.counts or code is None or not 0 <= position < length:
+            return 0
+        packed = self.indexes[length][position, code]
+        return int.from_bytes(packed.tobytes(), "little") << self.offsets[length]
+
+
 class Crossword():
 
     def __init__(self, structure_file, words_file):
@@ -57,9 +317,14 @@ class Crossword():
                         row.append(False)
                 self.structure.append(row)
 
-        # Save vocabulary list
-        with open(words_file) as f:
-            self.words = set(f.read().upper().splitlines())
+        # Load the compiled dictionary, which numbers the vocabulary
+        self.dictionary = Dictionary(words_file)
+        self.alphabet = self.dictionary.alphabet
+
+        # Index the words as bitsets of word numbers by length and by
+        # (length, position, letter), filled in as they are looked up
+        self.length_index = LazyIndex(self.dictionary.length_bits)
+        self.letter_index = LazyIndex(self.dictionary.letter_bits)
 
         # Determine variable set
         self.variables = set()
@@ -104,30 +369,183 @@ class Crossword():
                             length=length
                         ))
 
+        # Index the variables through each cell of the grid
+        cell_variables = dict()
+        for variable in self.variables:
+            for cell in variable.cells:
+                cell_variables.setdefault(cell, []).append(variable)
+
         # Compute overlaps for each word
         # For any pair of variables v1, v2, their overlap is either:
         #    None, if the two variables do not overlap; or
         #    (i, j), where v1's ith character overlaps v2's jth character
-        self.overlaps = dict()
-        for v1 in self.variables:
-            for v2 in self.variables:
-                if v1 == v2:
-                    continue
-                cells1 = v1.cells
-                cells2 = v2.cells
-                intersection = set(cells1).intersection(cells2)
-                if not intersection:
-                    self.overlaps[v1, v2] = None
-                else:
-                    intersection = intersection.pop()
-                    self.overlaps[v1, v2] = (
-                        cells1.index(intersection),
-                        cells2.index(intersection)
-                    )
+        # Only overlapping pairs, which share a cell, are stored
+        self.overlaps = Overlaps()
+        for cell, variables in cell_variables.items():
+            for v1 in variables:
+                for v2 in variables:
+                    if v1 != v2:
+                        self.overlaps[v1, v2] = (
+                            v1.cells.index(cell),
+                            v2.cells.index(cell)
+                        )
+
+        # Overlapping variables of each variable
+        self.neighbor_sets = {variable: set() for variable in self.variables}
+        for v1, v2 in self.overlaps:
+            self.neighbor_sets[v1].add(v2)
+        self.neighbor_sets = {
+            variable: frozenset(neighbors)
+            for variable, neighbors in self.neighbor_sets.items()
+        }
+
+    @property
+    def vocabulary(self):
+        """List of words, in order by their numbers."""
+        return self.dictionary.vocabulary
+
+    @functools.cached_property
+    def words(self):
+        """Set of words in the vocabulary."""
+        return set(self.vocabulary)
 
     def neighbors(self, var):
         """Given a variable, return set of overlapping variables."""
-        return set(
-            v for v in self.variables
-            if v != var and self.overlaps[v, var]
+        return self.neighbor_sets[var]
+
+
+def file_stamp(path):
+    """
+    Return the modification time, in nanoseconds, and size of the file
+    at `path`.
+    """
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def compiled_source(path):
+    """
+    Return (digest, stamp) for the words file compiled into the dictionary
+    directory `path`, where stamp is its `file_stamp` when compiled, or
+    (None, None) if there is no complete dictionary there.
+    """
+    try:
+        with open(os.path.join(path, "source.txt")) as f:
+            digest, mtime, size = f.read().split()
+    except (OSError, ValueError):
+        return None, None
+    return digest, (int(mtime), int(size))
+
+
+def write_source(path, digest, stamp):
+    """
+    Write source.txt into the dictionary directory `path`, replacing any
+    earlier one in a single step.
+    """
+    temporary = os.path.join(path, f".source-{os.getpid()}.txt")
+    with open(temporary, "w") as f:
+        f.write(f"{digest} {stamp[0]} {stamp[1]}\n")
+    os.replace(temporary, os.path.join(path, "source.txt"))
+
+
+def restamp_dictionary(path, digest, stamp):
+    """
+    Record `stamp` as the words file's stamp in the dictionary directory
+    `path`, compiled from the same contents, so later loads skip hashing.
+    The dictionary is still usable if the directory is read-only.
+    """
+    try:
+        write_source(path, digest, stamp)
+    except OSError:
+        pass
+
+
+def compile_dictionary(words_file, path, digest, stamp):
+    """
+    Compile the words file `words_file`, whose SHA-256 digest is `digest`
+    and `file_stamp` is `stamp`, into the dictionary directory `path`
+    (see `Dictionary`).
+
+    The dictionary is written to a temporary directory beside `path` and
+    then renamed into place, so that no process ever reads a partly
+    written one. Should another process put an up-to-date one there
+    first, that one is kept.
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    temporary = tempfile.mkdtemp(prefix=".compiling-", dir=parent)
+    try:
+        os.chmod(temporary, 0o755)
+        write_dictionary(words_file, temporary, digest, stamp)
+
+        # Keep a dictionary another process has just put in place, or else
+        # move any stale one out of the way and swap in the new one
+        if compiled_source(path)[0] == digest:
+            return
+        if os.path.exists(path):
+            stale = tempfile.mkdtemp(prefix=".stale-", dir=parent)
+            try:
+                os.replace(path, stale)
+            except FileNotFoundError:
+                pass
+            shutil.rmtree(stale, ignore_errors=True)
+        try:
+            os.replace(temporary, path)
+        except OSError:
+            if compiled_source(path)[0] != digest:
+                raise
+    finally:
+        shutil.rmtree(temporary, ignore_errors=True)
+
+
+def write_dictionary(words_file, path, digest, stamp):
+    """
+    Write the compiled dictionary of `words_file`, whose SHA-256 digest is
+    `digest` and `file_stamp` is `stamp`, to the existing empty directory
+    `path`.
+    """
+    with open(words_file) as f:
+        words = set(f.read().upper().splitlines())
+    words.discard("")
+    vocabulary = sorted(words, key=lambda word: (len(word), word))
+    alphabet = sorted(set("".join(vocabulary)))
+    points = np.array([ord(letter) for letter in alphabet], dtype=np.uint32)
+
+    with open(os.path.join(path, "words.txt"), "w") as f:
+        f.writelines(word + "\n" for word in vocabulary)
+    with open(os.path.join(path, "alphabet.txt"), "w") as f:
+        f.write("".join(alphabet) + "\n")
+
+    # Encode the words of each length, then pack the bitsets of each
+    # position and letter over them
+    start = 0
+    lengths = []
+    while start < len(vocabulary):
+        length = len(vocabulary[start])
+        end = start
+        while end < len(vocabulary) and len(vocabulary[end]) == length:
+            end += 1
+        group = "".join(vocabulary[start:end]).encode("utf-32-le")
+        letters = np.searchsorted(
+            points, np.frombuffer(group, dtype=np.uint32)
+        ).astype(LETTER_DTYPE).reshape(end - start, length)
+        letters.tofile(os.path.join(path, f"letters-{length}.bin"))
+        index = np.memmap(
+            os.path.join(path, f"index-{length}.bin"), dtype=np.uint8, mode="w+",
+            shape=(length, len(alphabet), (end - start + 7) // 8)
         )
+        codes = np.arange(len(alphabet), dtype=LETTER_DTYPE)
+        for position in range(length):
+            matches = letters[:, position] == codes[:, None]
+            index[position] = np.packbits(matches, axis=1, bitorder="little")
+        index.flush()
+        del index
+        lengths.append((length, end - start))
+        start = end
+
+    with open(os.path.join(path, "lengths.txt"), "w") as f:
+        f.writelines(f"{length} {count}\n" for length, count in lengths)
+
+    # Mark the dictionary complete
+    write_source(path, digest, stamp)
+
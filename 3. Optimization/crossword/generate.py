@@ -1,21 +1,71 @@
+import collections
+import functools
+import heapq
+import itertools
+import multiprocessing
+import os
 import sys
 import random
+import time
+
+import numpy as np
 
 from crossword import *
 
+# Font used to draw letters in saved images
+FONT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                    "assets", "fonts", "OpenSans-Regular.ttf")
+
+# Search nodes in the shortest restart of a randomized search; run i
+# is cut off after LUBY_UNIT * luby(i) nodes
+LUBY_UNIT = 100
+
+# Configurations run side by side by the portfolio solver
+PORTFOLIO = [
+    {"unit": LUBY_UNIT, "lcv": True},
+    {"unit": 10 * LUBY_UNIT, "lcv": True},
+    {"unit": LUBY_UNIT, "lcv": False},
+    {"unit": 10 * LUBY_UNIT, "lcv": False},
+]
+
+
+class SearchCutoff(Exception):
+    """
+    Raised when a search runs out of nodes before finishing.
+    """
+
 
 class CrosswordCreator():
 
-    def __init__(self, crossword):
+    def __init__(self, crossword, lcv=True):
         """
         Create new CSP crossword generate.
+        Values are tried in least-constraining order if `lcv` is True,
+        and in random order otherwise.
         """
         self.crossword = crossword
+        self.lcv = lcv
         self.domains = {
-            var: self.crossword.words.copy()
+            var: WordSet(self.crossword, self.crossword.length_index[var.length])
             for var in self.crossword.variables
         }
 
+        # Undo log of (variable, previous domain bits) for every narrowing
+        self.trail = []
+
+        # Letter counts of each domain at each position, with the domain
+        # bits they were counted from
+        self.letter_counts = dict()
+
+        # Heap of (domain size, -degree, random tiebreak, count, variable)
+        # for choosing variables, with stale entries skipped when popped
+        self.variable_heap = None
+        self.heap_entries = itertools.count()
+
+        # Nodes visited by the current search, and the most it may visit
+        self.nodes = 0
+        self.node_limit = None
+
     def letter_grid(self, assignment):
         """
         Return 2D array representing a given assignment.
@@ -49,7 +99,7 @@ class CrosswordCreator():
         """
         Save crossword assignment to an image file.
         """
-        from PIL import Image, ImageDraw, ImageFont
+        Image, ImageDraw, font = image_tools()
         cell_size = 100
         cell_border = 2
         interior_size = cell_size - 2 * cell_border
@@ -62,7 +112,6 @@ class CrosswordCreator():
              self.crossword.height * cell_size),
             "black"
         )
-        font = ImageFont.truetype("assets/fonts/OpenSans-Regular.ttf", 80)
         draw = ImageDraw.Draw(img)
 
         for i in range(self.crossword.height):
@@ -77,10 +126,13 @@ class CrosswordCreator():
                 if self.crossword.structure[i][j]:
                     draw.rectangle(rect, fill="white")
                     if letters[i][j]:
-                        w, h = draw.textsize(letters[i][j], font=font)
+                        left, top, right, bottom = draw.textbbox(
+                            (0, 0), letters[i][j], font=font
+                        )
+                        w, h = right - left, bottom - top
                         draw.text(
-                            (rect[0][0] + ((interior_size - w) / 2),
-                             rect[0][1] + ((interior_size - h) / 2) - 10),
+                            (rect[0][0] + ((interior_size - w) / 2) - left,
+                             rect[0][1] + ((interior_size - h) / 2) - top),
                             letters[i][j], fill="black", font=font
                         )
 
@@ -90,9 +142,158 @@ class CrosswordCreator():
         """
         Enforce node and arc consistency, and then solve the CSP.
         """
+        self.reset_search()
+        self.enforce_node_consistency()
+        if not self.ac3():
+            return None
+        mark = len(self.trail)
+        assignment = self.backtrack(dict())
+
+        # Leave the domains as they were before the search
+        self.undo(mark)
+        self.variable_heap = None
+        return assignment
+
+    def solve_with_restarts(self, unit=LUBY_UNIT):
+        """
+        Enforce node and arc consistency, and then solve the CSP with a
+        randomized search restarted after LUBY_UNIT * luby(i) nodes on
+        the i-th run. Return None once a run finishes without a solution.
+        """
+        self.enforce_node_consistency()
+        if not self.ac3():
+            return None
+        mark = len(self.trail)
+        try:
+            for run in itertools.count(1):
+                self.reset_search(unit * luby(run))
+                try:
+                    return self.backtrack(dict())
+                except SearchCutoff:
+                    continue
+                finally:
+                    # Leave the domains as they were before the run
+                    self.undo(mark)
+        finally:
+            # Leave later searches without a node limit
+            self.reset_search()
+
+    def reset_search(self, node_limit=None):
+        """
+        Forget the variable heap and node count of any earlier search,
+        and let the next one visit up to `node_limit` nodes, if given.
+        """
+        self.variable_heap = None
+        self.nodes = 0
+        self.node_limit = node_limit
+
+    def solutions(self, limit=None, time_limit=None):
+        """
+        Enforce node and arc consistency, and then yield every solution of
+        the CSP in turn, each as a new dict, as the search finds them.
+        Stop after `limit` solutions, or once `time_limit` seconds have
+        passed, if given.
+        """
+        for assignment in self.search_all(limit, time_limit):
+            yield dict(assignment)
+
+    def count_solutions(self, limit=None, time_limit=None):
+        """
+        Enforce node and arc consistency, and then count the solutions of
+        the CSP without keeping them, up to `limit` solutions and
+        `time_limit` seconds, if given.
+
+        Return (count, finished), where `finished` is True if the search
+        covered every assignment and `count` is therefore exact.
+        """
+        count = 0
+        search = self.search_all(limit, time_limit)
+        while True:
+            try:
+                next(search)
+            except StopIteration as stop:
+                return count, stop.value
+            count += 1
+
+    def search_all(self, limit=None, time_limit=None):
+        """
+        Enforce node and arc consistency, and then yield every solution of
+        the CSP, as one dict that keeps changing as the search goes on.
+        Stop after `limit` solutions, or once `time_limit` seconds have
+        passed, if given, and return True if the search ran to the end.
+        """
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        self.reset_search()
         self.enforce_node_consistency()
-        self.ac3()
-        return self.backtrack(dict())
+        if not self.ac3():
+            return True
+        mark = len(self.trail)
+        found = 0
+        try:
+            for assignment in self.backtrack_all(dict(), deadline):
+                yield assignment
+                found += 1
+                if limit is not None and found >= limit:
+                    return False
+        except SearchCutoff:
+            return False
+        finally:
+            # Leave the domains as they were before the search
+            self.undo(mark)
+            self.reset_search()
+        return True
+
+    def narrow(self, variable, bits):
+        """
+        Replace the domain of `variable` by the words in `bits`,
+        recording the previous domain on the trail so it can be undone.
+        """
+        domain = self.domains[variable]
+        if bits != domain.bits:
+            self.trail.append((variable, domain.bits))
+            domain.bits = bits
+            self.push_variable(variable)
+
+    def undo(self, mark):
+        """
+        Restore every domain narrowed since the trail had length `mark`.
+        """
+        while len(self.trail) > mark:
+            variable, bits = self.trail.pop()
+            self.domains[variable].bits = bits
+            self.push_variable(variable)
+
+    def push_variable(self, variable):
+        """
+        Add `variable` to the heap used to select variables,
+        with its current domain size.
+        """
+        if self.variable_heap is not None:
+            heapq.heappush(self.variable_heap, (
+                len(self.domains[variable]),
+                -len(self.crossword.neighbors(variable)),
+                random.random(),
+                next(self.heap_entries),
+                variable
+            ))
+
+    def count_letters(self, variable, position):
+        """
+        Return an array holding, for each letter of the alphabet in order,
+        the number of words in the domain of `variable` with that letter
+        at `position`.
+        """
+        bits = self.domains[variable].bits
+        cached = self.letter_counts.get((variable, position))
+        if cached is not None and cached[0] == bits:
+            return cached[1]
+
+        counts = np.array([
+            (bits & self.crossword.letter_index[variable.length, position, letter]).bit_count()
+            for letter in self.crossword.alphabet
+        ])
+        self.letter_counts[variable, position] = (bits, counts)
+        return counts
 
     def enforce_node_consistency(self):
         """
@@ -100,16 +301,9 @@ class CrosswordCreator():
         (Remove any values that are inconsistent with a variable's unary
          constraints; in this case, the length of the word.)
         """
-        # Iterate through all the variables in a domain
+        # Keep only the words of the right length in each domain
         for variable in self.domains:
-            non_unary = []
-            for word in self.domains[variable]:
-                # If the word does not fit into the variable, remove it
-                if len(word) != variable.length:
-                    non_unary.append(word)
-            for word in non_unary:
-                self.domains[variable].remove(word)
-
+            self.domains[variable].bits &= self.crossword.length_index[variable.length]
 
     def revise(self, x, y):
         """
@@ -120,33 +314,25 @@ class CrosswordCreator():
         Return True if a revision was made to the domain of `x`; return
         False if no revision was made.
         """
-        changed = False
-        non_arc = set()
-
-        # Grab overlap index of each variable
-        if self.crossword.overlaps[x, y]:
-            x_index, y_index = self.crossword.overlaps[x, y]
-
-            # Compare the letters at the index of each word
-            # If y has a possible value that matches x, keep x.
-            for x_word in self.domains[x]:
-                arc_consistent = False
-                for y_word in self.domains[y]:
-                    if x_word[x_index] != y_word[y_index]:
-                        arc_consistent = True
-                        break
-                if not arc_consistent:
-                    non_arc.add(x_word)
-            
-            # Remove all words that didn't have a match
-            if len(non_arc) > 0:
-                for word in non_arc:
-                    self.domains[x].remove(word)
-                changed = True
-
-        # State whether a change has happened or not
-        return changed
-
+        overlap = self.crossword.overlaps[x, y]
+        if not overlap:
+            return False
+        x_index, y_index = overlap
+        letter_index = self.crossword.letter_index
+
+        # Find the letters y's remaining words can put in the shared cell
+        # and keep the words of x with one of those letters there
+        supported = 0
+        y_bits = self.domains[y].bits
+        for letter in self.crossword.alphabet:
+            if letter_index[y.length, y_index, letter] & y_bits:
+                supported |= letter_index[x.length, x_index, letter]
+
+        revised = self.domains[x].bits & supported
+        if revised == self.domains[x].bits:
+            return False
+        self.narrow(x, revised)
+        return True
 
     def ac3(self, arcs=None):
         """
@@ -157,19 +343,19 @@ class CrosswordCreator():
         Return True if arc consistency is enforced and no domains are empty;
         return False if one or more domains end up empty.
         """
-        queue = []
-        
+        queue = collections.deque()
+
         # Initialize queue with either arcs or neighbors
-        if arcs:
-            queue = arcs
+        if arcs is not None:
+            queue.extend(arcs)
         else:
             for variable1 in self.crossword.variables:
                 for variable2 in self.crossword.neighbors(variable1):
                     queue.append((variable1, variable2))
-        
+
         # Check each pair on queue to see if it can be revised
         while queue:
-            (x, y) = queue.pop(0)
+            (x, y) = queue.popleft()
             if self.revise(x, y):
                 if not self.domains[x]:
                     return False
@@ -218,6 +404,24 @@ class CrosswordCreator():
         return True
 
 
+    def consistent_value(self, var, value, assignment):
+        """
+        Return True if assigning `value` to `var` is consistent with an
+        `assignment` that is already consistent, checking only the
+        constraints that involve `var`.
+        """
+        if var.length != len(value):
+            return False
+        for other, word in assignment.items():
+            if other != var and word == value:
+                return False
+        for neighbor in self.crossword.neighbors(var):
+            if neighbor in assignment:
+                var_index, neighbor_index = self.crossword.overlaps[var, neighbor]
+                if value[var_index] != assignment[neighbor][neighbor_index]:
+                    return False
+        return True
+
     def order_domain_values(self, var, assignment):                     
         """
         Return a list of values in the domain of `var`, in order by
@@ -225,29 +429,24 @@ class CrosswordCreator():
         The first value in the list, for example, should be the one
         that rules out the fewest values among the neighbors of `var`.
         """
-        lst = []
-
-        # For each word in var domain, compare to each word in neighbor
-        for word in self.domains[var]:
-            count = 0
-            # Loop through all neighbors of var
-            for neighbor in self.crossword.neighbors(var):
-                # Skip if neighbor already has assignment
-                if neighbor in assignment:
-                    continue
-                overlap_index = self.crossword.overlaps[var, neighbor]
-                for a_word in self.domains[neighbor]:
-                    if word[overlap_index[0]] != a_word[overlap_index[1]]:
-                        count += 1
-            # Store values for each word
-            lst.append([word, count])
-        # Sort lst by count
-        lst.sort(key=lambda pair: pair[1])
-        # Make new list in the same order as lst, but remove the count num
-        odv_lst = list(word[0] for word in lst)
-
-        return odv_lst
-
+        ids = self.domains[var].ids()
+        letters = self.crossword.dictionary.letter_codes(var.length, ids)
+
+        # A word rules out each unassigned neighbor's words without its
+        # letter at the shared cell
+        ruled_out = np.zeros(len(ids), dtype=np.int64)
+        for neighbor in self.crossword.neighbors(var):
+            if neighbor in assignment:
+                continue
+            var_index, neighbor_index = self.crossword.overlaps[var, neighbor]
+            counts = self.count_letters(neighbor, neighbor_index)
+            ruled_out += len(self.domains[neighbor]) - counts[letters[:, var_index]]
+
+        # Break ties in a random order, different for each seed and restart
+        tiebreak = [random.random() for _ in range(len(ids))]
+        order = np.lexsort((tiebreak, ruled_out))
+        vocabulary = self.crossword.vocabulary
+        return [vocabulary[k] for k in ids[order].tolist()]
 
     def select_unassigned_variable(self, assignment):
         """
@@ -257,33 +456,26 @@ class CrosswordCreator():
         degree. If there is a tie, any of the tied variables are acceptable
         return values.
         """
-        lst = []
-
-        # Loop through variables in crossword
-        for variable in self.crossword.variables:
-            if variable not in assignment:
-                # Add every unassigned variable and the # of words in domain to lst
-                lst.append([variable, len(self.domains[variable])])
-
-        # Sort the lst asc on the # of words in domain
-        lst.sort(key=lambda pair: pair[1])
-        # Only retain the variable/word count pairs that have the lowest count
-        # Pair is a [var, word count]
-        lst = list(pair for pair in lst if pair[1] == lst[0][1])
-
-        # This drops the word count from pair and replaces it with the # of neighbors
-        for pair in lst:
-            pair[1] = len(self.crossword.neighbors(pair[0]))
-        # Reverse puts the highest # of neighbors at front of lst
-        lst.sort(reverse=True, key=lambda pair: pair[1])
-
-        # Create new list with min values and highest # of neighbors
-        # Var is a [var, # of neighbors]
-        min_lst = list(var[0] for var in lst if var[1] == lst[0][1])
-
-        # Return a random one
-        return random.choice(min_lst)
-
+        # Build the heap on first use
+        if self.variable_heap is None:
+            self.variable_heap = []
+            for variable in self.crossword.variables:
+                self.push_variable(variable)
+
+        # Rebuild it if stale entries pile up
+        elif len(self.variable_heap) > 4 * len(self.crossword.variables) + 1000:
+            self.variable_heap = []
+            for variable in self.crossword.variables:
+                if variable not in assignment:
+                    self.push_variable(variable)
+
+        # Pop entries until one is current for an unassigned variable
+        while self.variable_heap:
+            size, degree, tiebreak, entry, variable = self.variable_heap[0]
+            if variable not in assignment and size == len(self.domains[variable]):
+                return variable
+            heapq.heappop(self.variable_heap)
+        return None
 
     def backtrack(self, assignment):                               
         """
@@ -294,9 +486,10 @@ class CrosswordCreator():
 
         If no assignment is possible, return None.
         """
-        # Code used from schedule0.py from lecture. I really only changed the 
-        # function calls to be on the self obj. Arc consistency is not 
-        # implemented.
+        # Give up once the search has used up its nodes
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchCutoff()
 
         # Check if assignment is complete
         if self.assignment_complete(assignment):
@@ -304,15 +497,141 @@ class CrosswordCreator():
 
         # Try a new variable
         variable = self.select_unassigned_variable(assignment)
-        for value in self.order_domain_values(variable, assignment):
-            new_assignment = assignment.copy()
-            new_assignment[variable] = value
-            if self.consistent(new_assignment):
-                result = self.backtrack(new_assignment)
+        for value in self.candidate_values(variable, assignment):
+            if not self.consistent_value(variable, value, assignment):
+                continue
+            mark = len(self.trail)
+            assignment[variable] = value
+            if self.infer(variable, value, assignment):
+                result = self.backtrack(assignment)
                 if result is not None:
                     return result
+
+            # Undo the assignment and everything inferred from it
+            del assignment[variable]
+            self.undo(mark)
+            self.push_variable(variable)
         return None
 
+    def backtrack_all(self, assignment, deadline=None):
+        """
+        Using Backtracking Search, yield every complete assignment that
+        extends the partial `assignment`, each time as `assignment` itself.
+
+        Raise SearchCutoff once `time.monotonic()` passes `deadline`.
+        """
+        if deadline is not None and time.monotonic() > deadline:
+            raise SearchCutoff()
+
+        # Check if assignment is complete
+        if self.assignment_complete(assignment):
+            yield assignment
+            return
+
+        # Try every value of a new variable
+        variable = self.select_unassigned_variable(assignment)
+        for value in self.candidate_values(variable, assignment):
+            if not self.consistent_value(variable, value, assignment):
+                continue
+            mark = len(self.trail)
+            assignment[variable] = value
+            if self.infer(variable, value, assignment):
+                yield from self.backtrack_all(assignment, deadline)
+
+            # Undo the assignment and everything inferred from it
+            del assignment[variable]
+            self.undo(mark)
+            self.push_variable(variable)
+
+    def candidate_values(self, variable, assignment):
+        """
+        Return the values of `variable` in the order to try them:
+        least-constraining first if `self.lcv` is True, else shuffled.
+        """
+        if self.lcv:
+            return self.order_domain_values(variable, assignment)
+        values = list(self.domains[variable])
+        random.shuffle(values)
+        return values
+
+    def infer(self, variable, value, assignment):
+        """
+        Narrow the domains after assigning `value` to `variable`: the
+        variable keeps only `value`, no other variable may use it, and arc
+        consistency is restored around every changed domain.
+
+        Return False if some domain ends up empty.
+        """
+        bit = 1 << self.crossword.dictionary.word_id(value)
+        self.narrow(variable, bit)
+        changed = [variable]
+        for other in self.crossword.variables:
+            if other not in assignment and self.domains[other].bits & bit:
+                self.narrow(other, self.domains[other].bits & ~bit)
+                if not self.domains[other]:
+                    return False
+                changed.append(other)
+
+        return self.ac3([
+            (neighbor, y)
+            for y in changed
+            for neighbor in self.crossword.neighbors(y)
+            if neighbor not in assignment
+        ])
+
+
+@functools.lru_cache(maxsize=None)
+def image_tools():
+    """
+    Import PIL and load the font for `save`, once per process.
+    Return (Image, ImageDraw, font).
+    """
+    from PIL import Image, ImageDraw, ImageFont
+    return Image, ImageDraw, ImageFont.truetype(FONT, 80)
+
+
+def luby(i):
+    """
+    Return the i-th term, counting from 1, of the Luby sequence
+    1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ...
+    """
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    if i == (1 << k) - 1:
+        return 1 << (k - 1)
+    return luby(i - (1 << (k - 1)) + 1)
+
+
+def portfolio_solve(structure, words, processes=None, seed=0, portfolio=PORTFOLIO):
+    """
+    Solve a crossword by running differently seeded and configured
+    searches with restarts in parallel, one per configuration in
+    `portfolio` and worker process. Return the first solution found,
+    stopping the other searches, or None if a search proves there is none.
+    """
+    # Compile the words once, before the searches all load them
+    Dictionary(words)
+
+    jobs = [
+        (structure, words, seed + k, config)
+        for k, config in enumerate(portfolio)
+    ]
+    with multiprocessing.Pool(processes or len(jobs)) as pool:
+        for assignment in pool.imap_unordered(run_portfolio_member, jobs):
+            return assignment
+
+
+def run_portfolio_member(job):
+    """
+    Run one search of the portfolio, given as
+    (structure, words, seed, config), and return its result.
+    """
+    structure, words, seed, config = job
+    random.seed(seed)
+    creator = CrosswordCreator(Crossword(structure, words), lcv=config["lcv"])
+    return creator.solve_with_restarts(config["unit"])
+
 
 def main():
 
@@ -0,0 +1,28 @@
+import sys
+
+from shopping import INDEXES, index_report, load_data
+
+
+def main():
+
+    # Check command-line arguments
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python benchmark.py data [index ...]")
+    indexes = sys.argv[2:] or list(INDEXES)
+    for index in indexes:
+        if index not in INDEXES:
+            sys.exit(f"Index must be one of: {', '.join(INDEXES)}")
+
+    # Compare the indexes with exact search
+    evidence, labels = load_data(sys.argv[1])
+    report = index_report(evidence, labels, indexes)
+
+    # Print results
+    print(f"{'Index':<12} {'Recall':>8} {'Agreement':>9} {'Fit ms':>8} {'us/query':>9}")
+    for row in report:
+        print(f"{row['index']:<12} {row['recall']:>8.2%} {row['agreement']:>9.2%} "
+              f"{1000 * row['fit']:>8.1f} {row['query']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import collections
+import io
+import signal
+import socketserver
+import sys
+import time
+
+import numpy as np
+
+from shopping import EVIDENCE, RECORD, encode_rows, load_model, split_records
+
+# Most sessions scored together
+MICRO_BATCH = 256
+
+# Micro-batches whose latencies are kept for the percentiles, the latest
+LATENCY_WINDOW = 100000
+
+
+def main():
+
+    # Check command-line arguments
+    if len(sys.argv) not in [2, 3]:
+        sys.exit("Usage: python serve.py model [port]")
+
+    # Load the model once for every request
+    model = load_model(sys.argv[1])
+    latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+    # Score sessions from stdin, or from each connection to the port
+    if len(sys.argv) == 2:
+        score_stream(model, sys.stdin, sys.stdout, latencies)
+    else:
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                score_stream(
+                    model,
+                    io.TextIOWrapper(self.rfile),
+                    io.TextIOWrapper(self.wfile, write_through=True),
+                    latencies
+                )
+
+        # Stop on an interrupt or a termination signal
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        with socketserver.ThreadingTCPServer(("localhost", int(sys.argv[2])), Handler) as server:
+            server.daemon_threads = True
+            server.block_on_close = False
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+
+    # Print latencies
+    report(latencies, sys.stderr)
+
+
+def score_stream(model, infile, outfile, latencies):
+    """
+    Read sessions from `infile`, one CSV row per line in the format of
+    shopping.csv with or without the Revenue column, and write the
+    predicted label of each to `outfile`, one per line.
+
+    Sessions are scored together in micro-batches, ended by a blank line,
+    by MICRO_BATCH sessions or by the end of the input. The seconds taken
+    by each micro-batch are added to `latencies`.
+    """
+    batch = []
+    for line in infile:
+        line = line.strip()
+        if line and not line.startswith(RECORD.names[0]):
+            batch.append(line)
+        if batch and (not line or len(batch) >= MICRO_BATCH):
+            score_batch(model, batch, outfile, latencies)
+            batch = []
+    if batch:
+        score_batch(model, batch, outfile, latencies)
+
+
+def score_batch(model, lines, outfile, latencies):
+    """
+    Write the predicted labels of the sessions in `lines` to `outfile`,
+    or one error line if they cannot be parsed, and add the seconds
+    taken to `latencies`.
+    """
+    start = time.perf_counter()
+    header = RECORD.names if lines[0].count(",") == len(EVIDENCE) else EVIDENCE
+    try:
+        evidence, _ = split_records(encode_rows(header, lines))
+    except (ValueError, IndexError) as error:
+        outfile.write(f"error: {error}\n")
+    else:
+        outfile.write("".join(f"{label}\n" for label in model.predict(evidence)))
+    outfile.flush()
+    latencies.append(time.perf_counter() - start)
+
+
+def report(latencies, outfile):
+    """
+    Write the number of micro-batches scored and their median and 99th
+    percentile latencies to `outfile`.
+    """
+    if not latencies:
+        print("No sessions scored.", file=outfile)
+        return
+    p50, p99 = 1000 * np.percentile(latencies, [50, 99])
+    print(f"Batches: {len(latencies)}", file=outfile)
+    print(f"p50 latency: {p50:.3f} ms", file=outfile)
+    print(f"p99 latency: {p99:.3f} ms", file=outfile)
+
+
+if __name__ == "__main__":
+    main()
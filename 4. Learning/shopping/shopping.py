@@ -1,18 +1,78 @@
 import csv
+import itertools
+import json
+import os
 import sys
+import time
 
+import numpy as np
+from sklearn.cluster import KMeans
 from sklearn.model_selection import train_test_split
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.metrics import confusion_matrix
+from sklearn.neighbors import BallTree, KDTree, KNeighborsClassifier
+from sklearn.preprocessing import StandardScaler
 
 TEST_SIZE = 0.4
 
+# Fields of a session record, in order, with their types
+RECORD = np.dtype([
+    ("Administrative", np.int32),
+    ("Administrative_Duration", np.float64),
+    ("Informational", np.int32),
+    ("Informational_Duration", np.float64),
+    ("ProductRelated", np.int32),
+    ("ProductRelated_Duration", np.float64),
+    ("BounceRates", np.float64),
+    ("ExitRates", np.float64),
+    ("PageValues", np.float64),
+    ("SpecialDay", np.float64),
+    ("Month", np.int8),
+    ("OperatingSystems", np.int16),
+    ("Browser", np.int16),
+    ("Region", np.int16),
+    ("TrafficType", np.int16),
+    ("VisitorType", np.int8),
+    ("Weekend", np.int8),
+    ("Revenue", np.int8),
+])
+
+# Fields used as evidence, and fields encoded from text rather than cast
+EVIDENCE = RECORD.names[:-1]
+ENCODED = ("Month", "VisitorType", "Weekend", "Revenue")
+
+# Type of the text columns as they are read
+TEXT = "U32"
+
+# Month abbreviations as they appear in the data, in order
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "June",
+          "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+# Rows parsed at a time when streaming a file
+CHUNK_ROWS = 65536
+
+# Sessions scored at a time when predicting
+BATCH_SIZE = 1024
+
+# Most distances held at once by the exact index
+BLOCK_ENTRIES = 1 << 20
+
+# Index used by `train_model` to find nearest neighbors; "auto" measures
+# every distance for up to EXACT_LIMIT training sessions, and uses a
+# KD-tree for more
+INDEX = "auto"
+EXACT_LIMIT = 50000
+
+# Version of the saved model format, raised whenever it changes
+MODEL_VERSION = 1
+
 
 def main():
 
     # Check command-line arguments
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python shopping.py data")
+    if len(sys.argv) not in [2, 3, 4]:
+        sys.exit("Usage: python shopping.py data [index] [model]")
+    index = sys.argv[2] if len(sys.argv) >= 3 else INDEX
+    if index != "auto" and index not in INDEXES:
+        sys.exit(f"Index must be auto or one of: {', '.join(INDEXES)}")
 
     # Load data from spreadsheet and split into train and test sets
     evidence, labels = load_data(sys.argv[1])
@@ -21,7 +81,7 @@ def main():
     )
 
     # Train model and make predictions
-    model = train_model(X_train, y_train)
+    model = train_model(X_train, y_train, index)
     predictions = model.predict(X_test)
     sensitivity, specificity = evaluate(y_test, predictions)
 
@@ -31,14 +91,18 @@ def main():
     print(f"True Positive Rate: {100 * sensitivity:.2f}%")
     print(f"True Negative Rate: {100 * specificity:.2f}%")
 
+    # Save the model for serving, if asked to
+    if len(sys.argv) == 4:
+        save_model(model, sys.argv[3])
+
 
 def load_data(filename):
     """
-    Load shopping data from a CSV file `filename` and convert into a list of
-    evidence lists and a list of labels. Return a tuple (evidence, labels).
+    Load shopping data from a CSV file `filename` and convert into an array
+    of evidence and an array of labels. Return a tuple (evidence, labels).
 
-    evidence should be a list of lists, where each list contains the
-    following values, in order:
+    evidence should be a float array with one row per session, containing
+    the following values, in order:
         - Administrative, an integer
         - Administrative_Duration, a floating point number
         - Informational, an integer
@@ -57,82 +121,101 @@ def load_data(filename):
         - VisitorType, an integer 0 (not returning) or 1 (returning)
         - Weekend, an integer 0 (if false) or 1 (if true)
 
-    labels should be the corresponding list of labels, where each label
+    labels should be the corresponding array of labels, where each label
     is 1 if Revenue is true, and 0 otherwise.
     """
-    evidence = []
-    labels = []
+    return split_records(load_records(filename))
+
 
-    # Read in the data and clean it
+def load_records(filename):
+    """
+    Load shopping data from a CSV file `filename` into a structured array
+    with the fields of RECORD, one element per session.
+    """
+    chunks = list(read_records(filename, chunk_rows=None))
+    if not chunks:
+        return np.zeros(0, dtype=RECORD)
+    return np.concatenate(chunks)
+
+
+def iter_data(filename, chunk_rows=CHUNK_ROWS):
+    """
+    Stream shopping data from a CSV file `filename` too big to load at
+    once, yielding (evidence, labels) like `load_data` for at most
+    `chunk_rows` sessions at a time.
+    """
+    for records in read_records(filename, chunk_rows):
+        yield split_records(records)
+
+
+def read_records(filename, chunk_rows=CHUNK_ROWS):
+    """
+    Yield structured arrays with the fields of RECORD for successive
+    chunks of at most `chunk_rows` rows of the CSV file `filename`,
+    or for the whole file at once if `chunk_rows` is None.
+    """
     with open(filename) as csvfile:
-        reader = list(csv.DictReader(csvfile))
-
-        int_lst = [
-            'Administrative',
-            'Informational',
-            'ProductRelated',
-            'Month',
-            'OperatingSystems',
-            'Browser',
-            'Region',
-            'TrafficType',
-            'VisitorType',
-            'Weekend'
-            ]
-
-        flt_lst = [
-            'Administrative_Duration',
-            'Informational_Duration',
-            'ProductRelated_Duration',
-            'BounceRates',
-            'ExitRates',
-            'PageValues',
-            'SpecialDay'
-            ]
-
-        month_dict = {
-            'Jan': 0,
-            'Feb': 1,
-            'Mar': 2,
-            'Apr': 3,
-            'May': 4,
-            'June': 5,
-            'Jul': 6,
-            'Aug': 7,
-            'Sep': 8,
-            'Oct': 9,
-            'Nov': 10,
-            'Dec': 11
-            }
-
-        for row in reader:
-            # Set month to numerical value from dict
-            row['Month'] = month_dict[row['Month']]
-            row['VisitorType'] = 1 if row['VisitorType'] == 'Returning_Visitor' else 0
-            row['Weekend'] = 1 if row['Weekend'] == 'TRUE' else 0
-            row['Revenue'] = 1 if row['Revenue'] == 'TRUE' else 0
-            # Typecast to int all items in int_lst
-            for item in int_lst:
-                row[item] = int(row[item])
-            # Typecast to float all items in flt_lst
-            for item in flt_lst:
-                row[item] = float(row[item])
-
-            # Append the cleaned data into the new lists
-            evidence.append(list(row.values())[:-1])
-            labels.append(list(row.values())[-1])
-
-    return (evidence, labels)
-
-
-def train_model(evidence, labels):
-    """
-    Given a list of evidence lists and a list of labels, return a
-    fitted k-nearest neighbor model (k=1) trained on the data.
-    """
-    # Choose the model and fit the data to the model
-    model = KNeighborsClassifier(n_neighbors=1)
-    return model.fit(evidence, labels)
+        header = next(csv.reader(csvfile))
+        while True:
+            lines = list(itertools.islice(csvfile, chunk_rows))
+            if not lines:
+                break
+            yield encode_rows(header, lines)
+            if chunk_rows is None:
+                break
+
+
+def encode_rows(header, lines):
+    """
+    Parse CSV `lines` with the column names `header` into a structured
+    array with the fields of RECORD, encoding each text column at once.
+    """
+    # Parse numbers straight into their types, keeping text as strings
+    columns = np.dtype([
+        (name, TEXT if name in ENCODED else RECORD[name])
+        for name in header
+    ])
+    rows = np.loadtxt(lines, dtype=columns, delimiter=",", ndmin=1)
+    records = np.empty(len(rows), dtype=RECORD)
+    for name in RECORD.names:
+        if name not in ENCODED:
+            records[name] = rows[name]
+
+    # Look up each distinct month once, then spread the indexes over rows
+    months, inverse = np.unique(rows["Month"], return_inverse=True)
+    records["Month"] = np.array(
+        [MONTHS.index(month) for month in months], dtype=np.int8
+    )[inverse]
+
+    # Encode the text and boolean columns
+    records["VisitorType"] = rows["VisitorType"] == "Returning_Visitor"
+    records["Weekend"] = rows["Weekend"] == "TRUE"
+    if "Revenue" in rows.dtype.names:
+        records["Revenue"] = rows["Revenue"] == "TRUE"
+    else:
+        records["Revenue"] = 0
+    return records
+
+
+def split_records(records):
+    """
+    Given a structured array of sessions, return a tuple (evidence, labels)
+    of the float evidence matrix and the integer label array.
+    """
+    evidence = np.empty((len(records), len(EVIDENCE)))
+    for k, name in enumerate(EVIDENCE):
+        evidence[:, k] = records[name]
+    return (evidence, records["Revenue"].astype(np.int64))
+
+
+def train_model(evidence, labels, index=INDEX):
+    """
+    Given an array of evidence and an array of labels, return a fitted
+    1-nearest-neighbor model trained on the standardized data, finding
+    neighbors with the index named `index` in INDEXES, or chosen by the
+    number of sessions if `index` is "auto".
+    """
+    return NearestNeighborModel(index).fit(evidence, labels)
 
 
 def evaluate(labels, predictions):
@@ -150,18 +233,261 @@ def evaluate(labels, predictions):
     representing the "true negative rate": the proportion of
     actual negative labels that were accurately identified.
     """
-    # Scikit has a confusion_matrix function
-    # https://scikit-learn.org/stable/modules/generated/sklearn.metrics.confusion_matrix.html#sklearn.metrics.confusion_matrix
-    tn, fp, fn, tp = confusion_matrix(labels, predictions).ravel()
-
-    # These equations are founds in the scikit documentation
-    # https://scikit-learn.org/stable/modules/model_evaluation.html#confusion-matrix
-    # Sensitivity is called "recall" in the docs
-    sensitivity = tp / (tp + fn)
-    specificity = tn / (tn + fp)
+    # Count the correct predictions among the actual positives and negatives
+    labels = np.asarray(labels)
+    correct = labels == np.asarray(predictions)
+    positives = labels == 1
+    sensitivity = correct[positives].sum() / positives.sum()
+    specificity = correct[~positives].sum() / (~positives).sum()
 
     return (sensitivity, specificity)
 
 
+class NearestNeighborModel():
+    """
+    1-nearest-neighbor classifier that standardizes each feature to zero
+    mean and unit variance and finds neighbors with a pluggable index.
+    """
+
+    def __init__(self, index=INDEX, **options):
+        self.index_name = index
+        self.options = options
+        self.index = None
+        self.scaler = StandardScaler()
+        self.points = None
+        self.labels = None
+
+    def fit(self, evidence, labels):
+        """
+        Fit the scaler and the index to the evidence, and keep the labels.
+        """
+        self.points = self.scaler.fit_transform(evidence)
+        self.build_index()
+        self.labels = np.asarray(labels)
+        return self
+
+    def build_index(self):
+        """
+        Index the standardized training points, first settling on an
+        index if it was left to be chosen automatically.
+        """
+        if self.index_name == "auto":
+            self.index_name = "exact" if len(self.points) <= EXACT_LIMIT else "kdtree"
+        self.index = INDEXES[self.index_name](**self.options)
+        self.index.fit(self.points)
+
+    def neighbors(self, evidence, batch_size=BATCH_SIZE):
+        """
+        Return the row number in the training data of the nearest
+        neighbor of each session, querying `batch_size` sessions at once.
+        """
+        evidence = np.asarray(evidence, dtype=np.float64)
+        nearest = np.empty(len(evidence), dtype=np.int64)
+        for low in range(0, len(evidence), batch_size):
+            batch = self.scaler.transform(evidence[low:low + batch_size])
+            nearest[low:low + batch_size] = self.index.query(batch)
+        return nearest
+
+    def predict(self, evidence, batch_size=BATCH_SIZE):
+        """
+        Return the label of the nearest neighbor of each session.
+        """
+        return self.labels[self.neighbors(evidence, batch_size)]
+
+
+def save_model(model, path):
+    """
+    Save a fitted NearestNeighborModel to the directory `path`:
+        model.json      format version, index and options, the evidence
+                        fields and month names the model was trained on,
+                        and the scaler's means and scales
+        points.npy      the standardized training evidence
+        labels.npy      the training labels
+    """
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "points.npy"), model.points)
+    np.save(os.path.join(path, "labels.npy"), model.labels)
+    with open(os.path.join(path, "model.json"), "w") as f:
+        json.dump({
+            "version": MODEL_VERSION,
+            "index": model.index_name,
+            "options": model.options,
+            "fields": list(EVIDENCE),
+            "months": MONTHS,
+            "mean": model.scaler.mean_.tolist(),
+            "scale": model.scaler.scale_.tolist(),
+        }, f, indent=4)
+
+
+def load_model(path):
+    """
+    Load a NearestNeighborModel saved by `save_model` to `path`, with
+    its training arrays memory-mapped rather than read into memory.
+
+    Raise ValueError if the model was saved in another format version
+    or for another encoding of the evidence.
+    """
+    with open(os.path.join(path, "model.json")) as f:
+        saved = json.load(f)
+    if saved["version"] != MODEL_VERSION:
+        raise ValueError(f"Model version {saved['version']} is not {MODEL_VERSION}")
+    if saved["fields"] != list(EVIDENCE) or saved["months"] != MONTHS:
+        raise ValueError("Model was trained on another encoding of the evidence")
+
+    # Restore the scaler, then index the training points
+    model = NearestNeighborModel(saved["index"], **saved["options"])
+    model.scaler.mean_ = np.array(saved["mean"])
+    model.scaler.scale_ = np.array(saved["scale"])
+    model.scaler.var_ = model.scaler.scale_ ** 2
+    model.scaler.n_features_in_ = len(EVIDENCE)
+    model.points = np.load(os.path.join(path, "points.npy"), mmap_mode="r")
+    model.labels = np.load(os.path.join(path, "labels.npy"), mmap_mode="r")
+    model.build_index()
+    return model
+
+
+class ExactIndex():
+    """
+    Nearest neighbors by computing every squared distance, for as many
+    queries at a time as fit in BLOCK_ENTRIES distances.
+    """
+
+    def fit(self, points):
+        self.points = points
+        self.norms = (points ** 2).sum(axis=1)
+
+    def query(self, queries):
+        nearest = np.empty(len(queries), dtype=np.int64)
+        rows = max(1, BLOCK_ENTRIES // len(self.points))
+        for low in range(0, len(queries), rows):
+            distances = self.norms - 2 * queries[low:low + rows] @ self.points.T
+            nearest[low:low + rows] = distances.argmin(axis=1)
+        return nearest
+
+
+class TreeIndex():
+    """
+    Exact nearest neighbors from a KD-tree or a ball tree.
+    """
+
+    def __init__(self, tree=KDTree, leaf_size=40):
+        self.tree = tree
+        self.leaf_size = leaf_size
+
+    def fit(self, points):
+        self.points = self.tree(points, leaf_size=self.leaf_size)
+
+    def query(self, queries):
+        return self.points.query(queries, k=1, return_distance=False)[:, 0]
+
+
+class ClusterIndex():
+    """
+    Approximate nearest neighbors from an inverted file: the points are
+    split into `cells` k-means cells (by default about the square root of
+    their number), and each query only measures the points of the
+    `probes` cells with the nearest centers.
+    """
+
+    def __init__(self, cells=None, probes=8, seed=0):
+        self.cells = cells
+        self.probes = probes
+        self.seed = seed
+
+    def fit(self, points):
+        cells = self.cells or max(1, int(np.sqrt(len(points))))
+
+        # Find the cell centers from a sample of the points
+        generator = np.random.default_rng(self.seed)
+        sample = generator.choice(len(points), min(len(points), 64 * cells), replace=False)
+        kmeans = KMeans(cells, n_init=1, random_state=self.seed).fit(points[sample])
+        self.centers = kmeans.cluster_centers_
+        self.center_norms = (self.centers ** 2).sum(axis=1)
+
+        # Store the points grouped by cell, remembering their row numbers
+        assigned = kmeans.predict(points)
+        self.rows = np.argsort(assigned, kind="stable")
+        self.points = np.asarray(points)[self.rows]
+        self.norms = (self.points ** 2).sum(axis=1)
+        self.bounds = np.searchsorted(assigned[self.rows], np.arange(cells + 1))
+
+    def query(self, queries):
+        distances = self.center_norms - 2 * queries @ self.centers.T
+        probes = min(self.probes, len(self.centers))
+        probed = np.argpartition(distances, probes - 1, axis=1)[:, :probes]
+
+        # Visit each probed cell once, with every query probing it
+        cells = probed.ravel()
+        order = np.argsort(cells, kind="stable")
+        cells = cells[order]
+        asking = np.repeat(np.arange(len(queries)), probes)[order]
+        starts = np.flatnonzero(np.diff(cells, prepend=-1))
+        best = np.full(len(queries), np.inf)
+        nearest = np.zeros(len(queries), dtype=np.int64)
+        for cell, rows in zip(cells[starts], np.split(asking, starts[1:])):
+            low, high = self.bounds[cell], self.bounds[cell + 1]
+            if low == high:
+                continue
+            distances = self.norms[low:high] - 2 * queries[rows] @ self.points[low:high].T
+            closest = distances.argmin(axis=1)
+            found = distances[np.arange(len(rows)), closest]
+            better = found < best[rows]
+            best[rows[better]] = found[better]
+            nearest[rows[better]] = self.rows[low + closest[better]]
+        return nearest
+
+
+def index_report(evidence, labels, indexes=None, repeats=3):
+    """
+    Compare each index in `indexes` (default: all of INDEXES) with exact
+    brute-force 1-NN search on a train/test split of the data. Return a
+    list of dicts with the index name, the fraction of test sessions given
+    a true nearest neighbor ("recall"), the fraction given the exact
+    model's prediction ("agreement"), the fit time in seconds and the best
+    of `repeats` query times, in microseconds per session.
+    """
+    X_train, X_test, y_train, y_test = train_test_split(
+        evidence, labels, test_size=TEST_SIZE, random_state=0
+    )
+
+    # Find the exact nearest distances and predictions on the same features
+    scaler = StandardScaler().fit(X_train)
+    points, queries = scaler.transform(X_train), scaler.transform(X_test)
+    exact = KNeighborsClassifier(n_neighbors=1, algorithm="brute").fit(points, y_train)
+    nearest_distances = exact.kneighbors(queries)[0][:, 0]
+    exact_predictions = exact.predict(queries)
+
+    report = []
+    for name in indexes or INDEXES:
+        start = time.perf_counter()
+        model = NearestNeighborModel(name).fit(X_train, y_train)
+        fit_time = time.perf_counter() - start
+        query_time = np.inf
+        for _ in range(repeats):
+            start = time.perf_counter()
+            nearest = model.neighbors(X_test)
+            query_time = min(query_time, time.perf_counter() - start)
+
+        # Count ties with the nearest distance as hits
+        distances = np.sqrt(((points[nearest] - queries) ** 2).sum(axis=1))
+        report.append({
+            "index": name,
+            "recall": np.mean(distances <= nearest_distances + 1e-9),
+            "agreement": np.mean(y_train[nearest] == exact_predictions),
+            "fit": fit_time,
+            "query": 1e6 * query_time / len(X_test),
+        })
+    return report
+
+
+# Indexes available to NearestNeighborModel, by name
+INDEXES = {
+    "exact": ExactIndex,
+    "kdtree": lambda **options: TreeIndex(KDTree, **options),
+    "balltree": lambda **options: TreeIndex(BallTree, **options),
+    "cluster": ClusterIndex,
+}
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,153 @@
+import itertools
+import multiprocessing
+import sys
+
+import numpy as np
+from sklearn.metrics import pairwise_distances
+from sklearn.model_selection import StratifiedKFold
+from sklearn.preprocessing import StandardScaler
+
+from shopping import load_data
+
+# Folds of the cross-validation
+FOLDS = 10
+
+# Settings swept: neighbors consulted, distance metric, feature scaling
+# and weighting of each neighbor's vote by class
+NEIGHBORS = [1, 3, 5, 7, 9, 15, 25]
+METRICS = ["euclidean", "manhattan", "chebyshev"]
+SCALINGS = ["none", "standard"]
+WEIGHTINGS = ["uniform", "balanced"]
+
+# z-score of the confidence intervals (95%)
+CONFIDENCE_Z = 1.96
+
+# Most distances held at once when measuring a fold
+BLOCK_ENTRIES = 1 << 20
+
+
+def main():
+
+    # Check command-line arguments
+    if len(sys.argv) not in [2, 3]:
+        sys.exit("Usage: python sweep.py data [processes]")
+    processes = int(sys.argv[2]) if len(sys.argv) == 3 else None
+
+    # Load data and sweep every setting over every fold
+    evidence, labels = load_data(sys.argv[1])
+    results = sweep(evidence, labels, processes=processes)
+
+    # Print results, best balanced accuracy first
+    results.sort(key=lambda result: -(result["sensitivity"] + result["specificity"]))
+    print(f"{'k':>3} {'Metric':<10} {'Scaling':<9} {'Weighting':<9} "
+          f"{'Sensitivity':>16} {'Specificity':>16}")
+    for result in results:
+        print(f"{result['k']:>3} {result['metric']:<10} {result['scaling']:<9} "
+              f"{result['weighting']:<9} "
+              f"{100 * result['sensitivity']:>7.2f}% ± {100 * result['sensitivity_error']:5.2f} "
+              f"{100 * result['specificity']:>7.2f}% ± {100 * result['specificity_error']:5.2f}")
+
+
+def sweep(evidence, labels, folds=FOLDS, processes=None, seed=0):
+    """
+    Cross-validate a k-nearest-neighbor classifier with every combination
+    of NEIGHBORS, METRICS, SCALINGS and WEIGHTINGS over `folds` stratified
+    folds, measuring each fold in a pool of `processes` worker processes.
+
+    Return a list of dicts, one per combination, with its settings, the
+    mean sensitivity and specificity over the folds, and the half-widths
+    of their confidence intervals.
+    """
+    splits = list(StratifiedKFold(folds, shuffle=True, random_state=seed).split(evidence, labels))
+    jobs = list(itertools.product(range(folds), METRICS, SCALINGS))
+
+    # Measure each fold once per metric and scaling, for all k and weightings
+    with multiprocessing.Pool(processes, initializer=share_data,
+                              initargs=(evidence, labels, splits)) as pool:
+        measured = pool.map(measure_fold, jobs)
+
+    # Gather the rates of each combination across folds
+    rates = dict()
+    for (fold, metric, scaling), fold_rates in zip(jobs, measured):
+        for (k, weighting), rate in fold_rates.items():
+            rates.setdefault((k, metric, scaling, weighting), []).append(rate)
+
+    results = []
+    for (k, metric, scaling, weighting), fold_rates in rates.items():
+        fold_rates = np.array(fold_rates)
+        means = fold_rates.mean(axis=0)
+        errors = CONFIDENCE_Z * fold_rates.std(axis=0, ddof=1) / np.sqrt(len(fold_rates))
+        results.append({
+            "k": k, "metric": metric, "scaling": scaling, "weighting": weighting,
+            "sensitivity": means[0], "specificity": means[1],
+            "sensitivity_error": errors[0], "specificity_error": errors[1],
+        })
+    return results
+
+
+# Data and folds shared by the jobs run in a worker process
+worker_data = None
+
+
+def share_data(evidence, labels, splits):
+    """
+    Store the data and folds for the jobs run in this worker process.
+    """
+    global worker_data
+    worker_data = (evidence, labels, splits)
+
+
+def measure_fold(job):
+    """
+    Return the (sensitivity, specificity) on one fold of every value of
+    k and weighting, as a dict keyed by (k, weighting), for the job
+    (fold, metric, scaling).
+
+    Distances are measured a block of test sessions at a time, and only
+    the labels of each session's max(NEIGHBORS) nearest neighbors kept,
+    from which the predictions for every k are found.
+    """
+    fold, metric, scaling = job
+    evidence, labels, splits = worker_data
+    train, test = splits[fold]
+    X_train, X_test = evidence[train], evidence[test]
+    y_train, y_test = labels[train], labels[test]
+    if scaling == "standard":
+        scaler = StandardScaler().fit(X_train)
+        X_train, X_test = scaler.transform(X_train), scaler.transform(X_test)
+
+    # Find the labels of the nearest neighbors, nearest first
+    most = min(max(NEIGHBORS), len(train))
+    nearest = np.empty((len(test), most), dtype=y_train.dtype)
+    rows = max(1, BLOCK_ENTRIES // len(train))
+    for low in range(0, len(test), rows):
+        distances = pairwise_distances(X_test[low:low + rows], X_train, metric=metric)
+        closest = np.argpartition(distances, most - 1, axis=1)[:, :most]
+        order = np.argsort(np.take_along_axis(distances, closest, axis=1), axis=1, kind="stable")
+        nearest[low:low + rows] = y_train[np.take_along_axis(closest, order, axis=1)]
+
+    # Weight votes equally, or by the inverse of each class's frequency
+    weights = {
+        "uniform": (1, 1),
+        "balanced": (len(y_train) / (y_train == 0).sum(), len(y_train) / (y_train == 1).sum()),
+    }
+
+    # Count the positive votes among the first k neighbors, for every k
+    positive_votes = np.cumsum(nearest == 1, axis=1)
+    positives = y_test == 1
+    rates = dict()
+    for k in NEIGHBORS:
+        if k > most:
+            continue
+        votes = positive_votes[:, k - 1]
+        for weighting, (negative_weight, positive_weight) in weights.items():
+            predictions = positive_weight * votes > negative_weight * (k - votes)
+            rates[k, weighting] = (
+                predictions[positives].mean(),
+                1 - predictions[~positives].mean()
+            )
+    return rates
+
+
+if __name__ == "__main__":
+    main()